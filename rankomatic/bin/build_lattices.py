@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+"""Build the up/down/max lattice for n constraints in the binary format.
+
+The strict orders are split into shards that a process pool works through.
+Each finished shard is written to the checkpoint directory, so rerunning
+the same command after an interruption only builds the missing shards.
+The directory records the number of constraints and the shard size, and a
+build with different ones refuses to resume from it.
+
+To run:
+    cd $PROJECT_DIR
+    python -m rankomatic.bin.build_lattices <num constraints> [options]
+"""
+import argparse
+import cPickle
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+from rankomatic.lattice.binary import (write_lattice, binary_lattice_path,
+                                       RELATIONS, LATTICE_DIR)
+from rankomatic.lattice.space import OrderSpace, strict_orders, bit_indices
+
+DEFAULT_SHARD_SIZE = 2000
+# the edges over 7 constraints overflow the binary format's uint32 offsets
+MAX_CONSTRAINTS = 6
+ORDERS_FILE = 'orders.p'
+PARAMS_FILE = 'params.p'
+
+_space = None
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "num_constraints", type=int, choices=range(2, MAX_CONSTRAINTS + 1),
+        help="build the lattice over this many constraints"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=multiprocessing.cpu_count(),
+        help="number of worker processes, default is the number of CPUs"
+    )
+    parser.add_argument(
+        "-s", "--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+        help="number of orders per checkpointed shard, default is %d" %
+        DEFAULT_SHARD_SIZE
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        help="where finished shards are kept, default is "
+        "lattices/build_<n>cons"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="lattice file to write, default is lattices/gspace_<n>cons.lat"
+    )
+    parser.add_argument(
+        "--keep-checkpoints", action="store_true",
+        help="don't remove the checkpoint directory after a successful build"
+    )
+    return parser.parse_args()
+
+
+def checkpoint_dir(args):
+    if args.checkpoint_dir:
+        return args.checkpoint_dir
+    return os.path.join(LATTICE_DIR, 'build_%dcons' % args.num_constraints)
+
+
+def shard_path(directory, start):
+    return os.path.join(directory, 'shard_%09d.p' % start)
+
+
+def dump_atomically(obj, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(obj, f, protocol=cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return cPickle.load(f)
+
+
+def check_params(args, directory):
+    """Record the build's parameters, or exit if a resumed build's differ.
+
+    Shard boundaries depend on the shard size, so shards built with other
+    parameters would make a corrupt lattice.
+
+    """
+    params = (args.num_constraints, args.shard_size)
+    path = os.path.join(directory, PARAMS_FILE)
+    if os.path.exists(path):
+        saved = load(path)
+        if saved != params:
+            sys.exit("%s holds a build of %d constraints in shards of %d. "
+                     "Resume with those, or remove it to start over." %
+                     ((directory,) + saved))
+    elif os.listdir(directory):
+        sys.exit("%s holds a build with unknown parameters. Remove it to "
+                 "start over." % directory)
+    else:
+        dump_atomically(params, path)
+
+
+def load_or_enumerate_orders(n, directory):
+    path = os.path.join(directory, ORDERS_FILE)
+    if os.path.exists(path):
+        return load(path)
+    masks = sorted(strict_orders(n))
+    dump_atomically(masks, path)
+    return masks
+
+
+def init_worker(n, masks):
+    global _space
+    _space = OrderSpace(n, masks)
+
+
+def build_shard(job):
+    directory, start, end = job
+    shard = dict((rel, []) for rel in RELATIONS)
+    for i in xrange(start, end):
+        for rel in RELATIONS:
+            shard[rel].append(bit_indices(_space.related(rel, i)))
+    dump_atomically(shard, shard_path(directory, start))
+    return end - start
+
+
+def pending_shards(directory, num_orders, shard_size):
+    for start in xrange(0, num_orders, shard_size):
+        if not os.path.exists(shard_path(directory, start)):
+            yield directory, start, min(start + shard_size, num_orders)
+
+
+def build_shards(args, directory, masks):
+    jobs = list(pending_shards(directory, len(masks), args.shard_size))
+    num_done = len(masks) - sum(end - start for _, start, end in jobs)
+    if num_done:
+        print "Resuming: %d of %d orders already built" % (num_done,
+                                                          len(masks))
+    pool = multiprocessing.Pool(args.processes, initializer=init_worker,
+                                initargs=(args.num_constraints, masks))
+    started = time.time()
+    try:
+        for num_built in pool.imap_unordered(build_shard, jobs):
+            num_done += num_built
+            print "%d/%d orders (%.1fs)" % (num_done, len(masks),
+                                            time.time() - started)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def shard_rows(directory, num_orders, shard_size, rel):
+    for start in xrange(0, num_orders, shard_size):
+        for row in load(shard_path(directory, start))[rel]:
+            yield row
+
+
+def assemble(args, directory, masks):
+    output = args.output or binary_lattice_path(args.num_constraints)
+    relations = dict(
+        (rel, shard_rows(directory, len(masks), args.shard_size, rel))
+        for rel in RELATIONS
+    )
+    write_lattice(output, args.num_constraints, masks, relations)
+    return output
+
+
+if __name__ == "__main__":
+    args = get_args()
+    directory = checkpoint_dir(args)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    check_params(args, directory)
+    masks = load_or_enumerate_orders(args.num_constraints, directory)
+    build_shards(args, directory, masks)
+    output = assemble(args, directory, masks)
+    if not args.keep_checkpoints:
+        shutil.rmtree(directory)
+    print "Wrote %d-constraint lattice to %s" % (args.num_constraints, output)
@@ -0,0 +1,16 @@
+#! /usr/bin/env python
+"""Convert the pickled lattices to the binary format read by otorderd.
+
+To run:
+    cd $PROJECT_DIR
+    python -m rankomatic.bin.convert_lattices <num constraints> [...]
+"""
+import sys
+
+from rankomatic.lattice.binary import (convert_pickle, pickle_lattice_path,
+                                       binary_lattice_path)
+
+if __name__ == "__main__":
+    for n in [int(arg) for arg in sys.argv[1:]]:
+        convert_pickle(pickle_lattice_path(n), binary_lattice_path(n), n)
+        print "Converted %s" % binary_lattice_path(n)
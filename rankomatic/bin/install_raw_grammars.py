@@ -1,23 +1,77 @@
 #! /usr/bin/env python
-"""To run:
+"""Install every strict order over up to n constraints as a RawGrammar.
+
+Orders are generated lazily and inserted in batches. Orders that are
+already installed are skipped by the unique index, so the script can be
+rerun safely, e.g. to extend an existing install to more constraints.
+
+To run:
     cd $PROJECT_DIR
     python -m rankomatic.bin.install_raw_grammars <max number of constraints>
 """
-from ot.ordertheory import StrictOrders
+import argparse
+import time
+from itertools import islice
+
+from pymongo.errors import DuplicateKeyError
+from rankomatic.lattice.space import strict_orders, NUM_STRICT_ORDERS
 from rankomatic.models.grammar import RawGrammar
-from mongoengine import OperationError
-import sys
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "num_constraints", type=int, choices=range(1, 9),
+        help="install the orders over up to this many constraints"
+    )
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="number of orders per insert, default is %d" % DEFAULT_BATCH_SIZE
+    )
+    parser.add_argument(
+        "--drop", action="store_true",
+        help="remove all installed grammars first"
+    )
+    return parser.parse_args()
+
+
+def batches(orders, batch_size):
+    while True:
+        batch = list(islice(orders, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_batch(collection, batch):
+    docs = [{'grammar': mask} for mask in batch]
+    try:
+        collection.insert(docs, continue_on_error=True)
+    except DuplicateKeyError:
+        pass  # already installed
+
 
 if __name__ == "__main__":
-    upper_bound = int(sys.argv[1]) + 1
-    orders = StrictOrders()._StrictOrders__orders(range(1, upper_bound))
-    RawGrammar.objects.delete()
-    num_inserted = 0
-    for order in set(orders):
-        try:
-            order = frozenset(sorted(list(order)))
-            RawGrammar(grammar=str(order)).save()
-            num_inserted += 1
-        except OperationError:
-            pass
-    print "Successfully inserted %d grammars" % num_inserted
+    args = get_args()
+    collection = RawGrammar._get_collection()
+    if args.drop:
+        RawGrammar.objects.delete()
+    num_installed = collection.count()
+    num_orders = NUM_STRICT_ORDERS[args.num_constraints]
+    started = time.time()
+    num_done = 0
+    # a grammar's id doesn't depend on the number of constraints, so the
+    # orders over n constraints include those over fewer
+    orders = strict_orders(args.num_constraints)
+    for batch in batches(orders, args.batch_size):
+        insert_batch(collection, batch)
+        num_done += len(batch)
+        elapsed = time.time() - started
+        print "%d/%d orders (%.0f/s)" % (num_done, num_orders,
+                                         num_done / max(elapsed, 1e-6))
+    num_inserted = collection.count() - num_installed
+    print "Successfully inserted %d grammars in %.1fs" % (
+        num_inserted, time.time() - started)
+    print "%d were already installed" % (num_done - num_inserted)
@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+"""Move stored grammars from frozenset strings to integer grammar ids.
+
+RawGrammar documents used to hold str(frozenset) grammars, referenced from
+Grammar._raw_grammar_str, and global_stats['grams'] held a string that was
+eval'd. Grammar lists in the old format are dropped, and the datasets that
+used them, or that have string global stats, are reset so their grammars
+and stats are calculated again. A priori rankings are converted in place,
+then the string RawGrammars are removed.
+
+Install the integer grammars with install_raw_grammars first. The script
+can be rerun safely.
+
+To run:
+    cd $PROJECT_DIR
+    python -m rankomatic.bin.migrate_grammar_ids
+"""
+import argparse
+import re
+
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.models import Dataset
+from rankomatic.models.grammar import (RawGrammar, Grammar, GrammarList,
+                                       raw_grammar_table)
+
+OLD_REF = '_raw_grammar_str'
+PAIR_RE = re.compile(r'\((\d+), (\d+)\)')
+BSON_STRING = 2
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true",
+        help="only count what would be migrated"
+    )
+    return parser.parse_args()
+
+
+def parse_old_grammar(string):
+    """Return the grammar id of a str(frozenset) grammar."""
+    pairs = [(int(a), int(b)) for a, b in PAIR_RE.findall(string)]
+    return grammar_id(frozenset(pairs))
+
+
+def old_grammar_ids():
+    """Map the ObjectId of each string RawGrammar to its grammar id."""
+    spec = {'grammar': {'$type': BSON_STRING}}
+    docs = RawGrammar._get_collection().find(spec)
+    return dict((doc['_id'], parse_old_grammar(doc['grammar']))
+                for doc in docs)
+
+
+def convert_apriori_rankings(old_ids, dry_run):
+    collection = Dataset._get_collection()
+    spec = {'_apriori_ranking.' + OLD_REF: {'$exists': True}}
+    dsets = list(collection.find(spec, fields=['_apriori_ranking']))
+    field = Grammar._fields['_raw_grammar_doc']
+    for dset in ([] if dry_run else dsets):
+        old_ref = dset['_apriori_ranking'][OLD_REF]
+        oid = getattr(old_ref, 'id', old_ref)  # a DBRef or an ObjectId
+        ref = raw_grammar_table.refs([old_ids[oid]])[0]
+        collection.update({'_id': dset['_id']}, {
+            '$set': {'_apriori_ranking._raw_grammar_doc': field.to_mongo(ref)},
+            '$unset': {'_apriori_ranking.' + OLD_REF: 1}
+        })
+    return len(dsets)
+
+
+def reset_datasets(old_list_ids, dry_run):
+    collection = Dataset._get_collection()
+    spec = {'$or': [{'_grammars': {'$in': old_list_ids}},
+                    {'global_stats.grams': {'$type': BSON_STRING}}]}
+    num_dsets = collection.find(spec).count()
+    if not dry_run:
+        collection.update(spec, {
+            '$set': {'global_stats': {}, 'global_stats_calculated': False,
+                     'grammar_info': [], 'grammar_navbar': {},
+                     'grammar_stats_calculated': False},
+            '$unset': {'_grammars': 1}
+        }, multi=True)
+    return num_dsets
+
+
+def drop_old_grammar_lists(old_list_ids, dry_run):
+    if not dry_run:
+        GrammarList._get_collection().remove({'_id': {'$in': old_list_ids}})
+    return len(old_list_ids)
+
+
+def drop_old_raw_grammars(old_ids, dry_run):
+    if not dry_run:
+        RawGrammar._get_collection().remove({'_id': {'$in': old_ids.keys()}})
+    return len(old_ids)
+
+
+if __name__ == "__main__":
+    args = get_args()
+    old_ids = old_grammar_ids()
+    spec = {'grammars.' + OLD_REF: {'$exists': True}}
+    old_lists = GrammarList._get_collection().find(spec, fields=['_id'])
+    old_list_ids = [doc['_id'] for doc in old_lists]
+    print "%d a priori rankings converted" % convert_apriori_rankings(
+        old_ids, args.dry_run)
+    print "%d datasets reset" % reset_datasets(old_list_ids, args.dry_run)
+    print "%d grammar lists removed" % drop_old_grammar_lists(
+        old_list_ids, args.dry_run)
+    print "%d string grammars removed" % drop_old_raw_grammars(
+        old_ids, args.dry_run)
@@ -1,25 +1,98 @@
 #! /usr/bin/env python
+"""Remove orphaned GridFS chunks from MongoDB hosted on MongoHQ.
 
-"""Remove orphaned GridFS chunks from MongoDB hosted on MongoHQ"""
+The ids of the live files are read once, then the chunks are streamed
+(ids only) and the orphans removed in batches. Chunks written within the
+grace period are left alone, since a file's chunks are written before the
+file itself.
 
-import pymongo
+To run:
+    cd $PROJECT_DIR
+    python -m rankomatic.bin.remove_old_gridfs_chunks [mongodb uri]
+"""
+import argparse
 import os
-import sys
+import time
+from datetime import datetime, timedelta
+
+import pymongo
+from bson.objectid import ObjectId
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_GRACE_MINUTES = 60
+GRIDFS_COLLECTIONS = ['tmp', 'grammar_graphs']
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "uri", nargs="?", default=os.environ.get('MONGOHQ_URL'),
+        help="MongoDB URI, default is $MONGOHQ_URL"
+    )
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="chunks per remove, default is %d" % DEFAULT_BATCH_SIZE
+    )
+    parser.add_argument(
+        "-g", "--grace", type=int, default=DEFAULT_GRACE_MINUTES,
+        help="skip chunks younger than this many minutes, default is %d" %
+        DEFAULT_GRACE_MINUTES
+    )
+    parser.add_argument(
+        "-c", "--collection", action="append", dest="collections",
+        help="GridFS collection to clean, default is all of %s" %
+        ", ".join(GRIDFS_COLLECTIONS)
+    )
+    return parser.parse_args()
+
+
+def live_file_ids(files):
+    return set(f['_id'] for f in files.find({}, fields=['_id']))
+
+
+def orphan_batches(chunks, live_ids, cutoff, batch_size):
+    """Yield the ids of orphaned chunks older than cutoff, in batches."""
+    batch = []
+    spec = {'_id': {'$lt': ObjectId.from_datetime(cutoff)}}
+    for chunk in chunks.find(spec, fields=['files_id']):
+        if chunk['files_id'] not in live_ids:
+            batch.append(chunk['_id'])
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def data_size(db, collection):
+    return db.command('collstats', collection.name)['size']
 
-if len(sys.argv) > 1:
-    uri = sys.argv[1]
-else:
-    uri = os.environ.get('MONGOHQ_URL')
 
-if uri:
-    info = pymongo.uri_parser.parse_uri(uri)
-    cli = pymongo.MongoClient(uri)
-    db = cli[info['database']]
+def remove_orphans(db, fs_coll, batch_size, grace):
+    files = db[fs_coll].files
+    chunks = db[fs_coll].chunks
+    cutoff = datetime.utcnow() - timedelta(minutes=grace)
+    started = time.time()
+    size_before = data_size(db, chunks)
+    live_ids = live_file_ids(files)
+    num_removed = 0
+    for batch in orphan_batches(chunks, live_ids, cutoff, batch_size):
+        chunks.remove({'_id': {'$in': batch}})
+        num_removed += len(batch)
+        elapsed = time.time() - started
+        print "%s: removed %d chunks (%.0f/s)" % (
+            fs_coll, num_removed, num_removed / max(elapsed, 1e-6))
+    elapsed = max(time.time() - started, 1e-6)
+    reclaimed = size_before - data_size(db, chunks)
+    print "%s: removed %d orphaned chunks, %d bytes, in %.1fs (%.0f B/s)" % (
+        fs_coll, num_removed, reclaimed, elapsed, reclaimed / elapsed)
 
-    files = db.tmp.files
-    chunks = db.tmp.chunks
 
-    for doc in chunks.find():
-        files_id = doc['files_id']
-        if not files.find_one(files_id):
-            chunks.remove(doc['_id'])
+if __name__ == "__main__":
+    args = get_args()
+    if args.uri:
+        info = pymongo.uri_parser.parse_uri(args.uri)
+        cli = pymongo.MongoClient(args.uri)
+        db = cli[info['database']]
+        for fs_coll in args.collections or GRIDFS_COLLECTIONS:
+            remove_orphans(db, fs_coll, args.batch_size, args.grace)
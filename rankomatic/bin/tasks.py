@@ -1,14 +1,44 @@
 #! /usr/bin/env python
+"""Remove expired guest datasets and grammar graphs.
+
+Guest datasets expire a day after they were last accessed, and shared
+grammar graphs a month after they were last shown. The sweep is cheap, so
+it can run every few minutes with --interval instead of as a nightly job.
+Cached results are removed by a TTL index a month after their last use,
+and the sweep starts the clock on any stored before that was recorded.
+
+To run:
+    cd $PROJECT_DIR
+    python -m rankomatic.bin.tasks [--interval minutes]
+"""
+import argparse
+import time
+
 from ..models import Dataset
+from ..models.graphs import remove_expired_grammar_graphs
+from ..models.results import CachedResult
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--interval", type=int, default=0,
+        help="sweep every this many minutes, default is to sweep once"
+    )
+    return parser.parse_args()
+
 
-guest_dset_names = ["Kiparsky", "CV Syllabification"]
+def remove_expired():
+    num_dsets = Dataset.remove_expired()
+    num_graphs = remove_expired_grammar_graphs()
+    CachedResult.backfill_last_used()
+    print "removed %d guest datasets and %d grammar graph files" % (
+        num_dsets, num_graphs)
 
-def remove_temp_datasets():
-    guest_dsets = Dataset.objects(user='guest')
-    for dset in guest_dsets:
-        if dset.name not in guest_dset_names:
-            dset.remove_old_files()
-            dset.delete()
 
 if __name__ == "__main__":
-    remove_temp_datasets()
+    args = get_args()
+    remove_expired()
+    while args.interval > 0:
+        time.sleep(args.interval * 60)
+        remove_expired()
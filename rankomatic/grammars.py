@@ -1,12 +1,16 @@
+import datetime
 import urllib
 import gridfs
 import json
 
-from flask import (render_template, abort, Blueprint,
+from flask import (render_template, abort, Blueprint, Response,
                    make_response, request, redirect, url_for, jsonify)
 from flask.views import MethodView
 
-from rankomatic import db, worker_jobs
+from rankomatic import worker_jobs
+from rankomatic.models.graphs import (GridFSGraph, GrammarGraph,
+                                      RenderedGraph, RENDER_FORMATS)
+from rankomatic.models.job import Job, to_millis, from_millis
 from rankomatic.util import get_dset, get_username, get_url_args
 
 grammars = Blueprint('grammars', __name__,
@@ -22,9 +26,12 @@ class GrammarView(MethodView):
                                     page=0, sort_by='rank_volume'))
         classical, page, sort_by = get_url_args()
         self._initialize_dset(dset_name)
-        worker_jobs.calculate_grammars_and_statistics(dset_name, sort_value)
+        job_id = worker_jobs.calculate_grammars_and_statistics(
+            dset_name, sort_value, self.dset
+        )
         return(render_template('grammars.html', page=page,
-                               sort_value=sort_value, dset_name=dset_name))
+                               sort_value=sort_value, dset_name=dset_name,
+                               job_id=job_id))
 
     def _check_params(self):
         return (self._check_page() and
@@ -69,37 +76,58 @@ class GrammarView(MethodView):
 
 class GraphView(MethodView):
 
-    @property
-    def fs(self):
-        return gridfs.GridFS(db.get_pymongo_db(), collection='tmp')
+    FS_COLL = GridFSGraph.FS_COLL
+    # the ETag changes whenever a dataset's graph is stored again, so
+    # caches may keep the image but have to revalidate it
+    CACHE_CONTROL = 'public, no-cache'
 
     def get(self, dset_name, filename):
-        dset_name = urllib.quote(dset_name)
-        filename = self._make_graph_filename(dset_name, filename)
+        return self._get_graph(urllib.quote(dset_name), filename)
+
+    def _get_graph(self, dirname, filename):
+        basename, _, fmt = filename.rpartition('.')
+        if fmt not in RENDER_FORMATS:
+            abort(404)
+        path = self._make_graph_filename(dirname, basename)
         try:
-            return self._build_image_response(filename)
+            graph = RenderedGraph(path, fmt, self.FS_COLL)
         except gridfs.NoFile:
             abort(404)
+        return self._build_image_response(graph)
 
     def _make_graph_filename(self, dset_name, filename):
         return "".join([dset_name, '/', filename])
 
-    def _build_image_response(self, filename):
-        f = self.fs.get_last_version(filename=filename)
-        response = make_response(f.read())
-        response.mimetype = 'image/png'
+    def _build_image_response(self, graph):
+        if graph.etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            response = make_response(graph.read())
+            response.mimetype = graph.mimetype
+        response.set_etag(graph.etag)
+        response.headers['Cache-Control'] = self.CACHE_CONTROL
         return response
 
 
+class GrammarGraphView(GraphView):
+
+    FS_COLL = GrammarGraph.FS_COLL
+    # named by their content, so they never change
+    CACHE_CONTROL = 'public, max-age=31536000'
+
+    def get(self, filename):
+        return self._get_graph(GrammarGraph.DIRECTORY, filename)
+
+
 class EntailmentView(MethodView):
 
     def get(self, dset_name):
         dset = get_dset(dset_name)
         classical = dset.classical
-        worker_jobs.calculate_entailments(dset_name)
+        job_id = worker_jobs.calculate_entailments(dset_name, dset)
         return render_template('entailments.html', dset_name=dset_name,
                                apriori=dset.apriori_ranking.string,
-                               classical=classical)
+                               classical=classical, job_id=job_id)
 
 
 class EntailmentsCalculatedView(MethodView):
@@ -135,13 +163,15 @@ class GlobalStatsCalculatedView(MethodView):
         if self._need_redirect():
             self._display_redirect()
         elif self._grammars_selected():
-            worker_jobs.make_grammar_info(self.dset_name)
+            self.return_dict['grammar_stat_job'] = (
+                worker_jobs.make_grammar_info(self.dset_name, self.dset)
+            )
             self._display_global_stats()
         else:
             self._display_no_grammars_exist()
 
     def _get_grams(self):
-        self.grams = eval(self.dset.global_stats['grams'])
+        self.grams = self.dset.global_stats['grams']
 
     def _need_redirect(self):
         no_classical_sort_value = self.dset.classical and self.sort_value == 0
@@ -237,6 +267,53 @@ class AprioriEntailments(MethodView):
         return redirect(url_for('.entailments', dset_name=dset_name))
 
 
+class JobView(MethodView):
+    """Long poll for a job, answering once its state isn't ?state=."""
+
+    def get(self, job_id):
+        job = Job.objects.get_or_404(id=job_id)
+        seen_state = request.args.get('state')
+        if job.state == seen_state:
+            job = Job.wait(job_id, seen_state)
+        response = jsonify(**job.to_dict())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+class ProgressView(MethodView):
+    """Stream the dataset's jobs as server-sent events as they change.
+
+    The stream starts from ?since=, in milliseconds since the epoch, and
+    ends after a while. Each event's id is the time the job changed, so
+    the browser reconnects from the last one it got.
+
+    """
+
+    RECONNECT_MS = 1000
+
+    def get(self, dset_name):
+        dset = get_dset(dset_name)
+        return Response(self._events(dset.id, self._since()),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    def _since(self):
+        millis = (request.headers.get('Last-Event-ID') or
+                  request.args.get('since'))
+        if millis is None:
+            return datetime.datetime.utcnow()
+        try:
+            return from_millis(int(millis))
+        except ValueError:
+            abort(400)
+
+    def _events(self, dset_id, since):
+        yield 'retry: %d\n\n' % self.RECONNECT_MS
+        for job in Job.changes(dset_id, since):
+            yield 'id: %d\ndata: %s\n\n' % (to_millis(job.updated),
+                                             json.dumps(job.to_dict()))
+
+
 class StatProfileView(MethodView):
 
     def get(self, dset_name):
@@ -247,6 +324,8 @@ grammars.add_url_rule('/<dset_name>/grammars/<int:sort_value>',
                       view_func=GrammarView.as_view('grammars'))
 grammars.add_url_rule('/graphs/<dset_name>/<filename>',
                       view_func=GraphView.as_view('graph'))
+grammars.add_url_rule('/grammar_graphs/<filename>',
+                      view_func=GrammarGraphView.as_view('grammar_graph'))
 grammars.add_url_rule('/<dset_name>/entailments/',
                       view_func=EntailmentView.as_view('entailments'))
 grammars.add_url_rule('/entailments_calculated/<dset_name>/',
@@ -261,6 +340,9 @@ grammars.add_url_rule('/grammar_stats_calculated/<dset_name>/<int:sort_value>',
                       view_func=GrammarStatsCalculated.as_view(
                           'grammar_stats_calculated'
                       ))
+grammars.add_url_rule('/jobs/<job_id>', view_func=JobView.as_view('job'))
+grammars.add_url_rule('/<dset_name>/progress',
+                      view_func=ProgressView.as_view('progress'))
 grammars.add_url_rule('/<dset_name>/stat_profile',
                       view_func=StatProfileView.as_view('stat_profile'))
 grammars.add_url_rule('/<dset_name>/apriori_entailments/',
@@ -0,0 +1,34 @@
+"""
+Package: rankomatic.lattice
+
+Compact representations of the space of grammars (strict orders over the
+constraint set) used by the workers in place of the pickled lattices.
+
+encoding: Converts between frozenset grammars of (lower, higher) constraint
+          pairs and integer bitmasks over the n(n-1) ordered pairs, which
+          also serve as grammar ids.
+binary: Reads and writes the memory-mapped binary lattice format, one file
+        per number of constraints.
+space: Answers the same up/down/max queries directly from the flat array of
+       strict orders, for constraint counts without a lattice file.
+ercs: Elementary ranking conditions and Recursive Constraint Demotion.
+search: Finds compatible grammars by a pruned search over strict orders.
+extensions: Counts the total orders extending a grammar (its rank volume)
+            and those under which each candidate wins (its COT count).
+winners: Bitsets of the total orders under which each candidate wins.
+entailments: Entailments between candidates, as subset tests on those bitsets.
+"""
+import encoding
+import binary
+import space
+import ercs
+import search
+import extensions
+import winners
+import entailments
+
+MappedLattice = binary.MappedLattice
+OrderSpace = space.OrderSpace
+CompatibleGrammarSearch = search.CompatibleGrammarSearch
+LinearExtensions = extensions.LinearExtensions
+WinnerTable = winners.WinnerTable
@@ -0,0 +1,196 @@
+"""Memory-mapped binary lattice files.
+
+Each file holds the lattice for a single number of constraints. Every strict
+order is stored as a 64-bit pair bitmask (see encoding), sorted ascending,
+and the 'up', 'down' and 'max' sets of every order are stored as sorted
+arrays of indices into that order array, laid out like a CSR matrix:
+
+    header   magic, n, number of orders, (indptr, data) offset per relation
+    orders   uint64 * number of orders
+    per relation:
+        indptr   uint32 * (number of orders + 1)
+        data     uint32 * indptr[-1]
+
+All integers are little-endian. Workers mmap the file, so the pages are
+shared between processes and nothing is decoded until it is asked for.
+
+"""
+import cPickle
+import mmap
+import os
+import struct
+from collections import Mapping
+
+from encoding import grammar_to_mask, mask_to_grammar
+
+MAGIC = 'OTLATTC1'
+RELATIONS = ('up', 'down', 'max')
+LATTICE_DIR = 'lattices'
+
+_HEADER = struct.Struct('<8sII' + 'QQ' * len(RELATIONS))
+_ORDER = struct.Struct('<Q')
+_INDEX = struct.Struct('<I')
+
+
+def pickle_lattice_path(n, lattice_dir=LATTICE_DIR):
+    return os.path.join(lattice_dir, 'gspace_%dcons.p' % n)
+
+
+def binary_lattice_path(n, lattice_dir=LATTICE_DIR):
+    return os.path.join(lattice_dir, 'gspace_%dcons.lat' % n)
+
+
+def write_lattice(path, n, masks, relations):
+    """Write a binary lattice file.
+
+    masks is the sorted list of order bitmasks, relations maps each name in
+    RELATIONS to an iterable yielding, for every order in turn, the sorted
+    indices of the related orders. Rows are streamed to disk one at a time,
+    so only the row offsets are ever held in memory.
+
+    """
+    with open(path, 'wb') as f:
+        f.write('\0' * _HEADER.size)
+        f.write(_pack_array('Q', masks))
+        offsets = []
+        for rel in RELATIONS:
+            offsets.extend(_write_csr(f, len(masks), relations[rel]))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, n, len(masks), *offsets))
+
+
+def _write_csr(f, num_rows, rows):
+    indptr_offset = f.tell()
+    f.write('\0' * ((num_rows + 1) * _INDEX.size))
+    data_offset = f.tell()
+    indptr = [0]
+    for row in rows:
+        f.write(_pack_array('I', row))
+        indptr.append(indptr[-1] + len(row))
+    if len(indptr) != num_rows + 1:
+        raise ValueError("expected %d rows, got %d" % (num_rows,
+                                                       len(indptr) - 1))
+    end = f.tell()
+    f.seek(indptr_offset)
+    f.write(_pack_array('I', indptr))
+    f.seek(end)
+    return indptr_offset, data_offset
+
+
+def convert_pickle(pickle_path, path, n):
+    """Convert one of the old gspace_*cons.p pickles to the binary format."""
+    with open(pickle_path, 'rb') as f:
+        lattice = cPickle.load(f)
+    masks = sorted(grammar_to_mask(g, n) for g in lattice)
+    index_of = dict((m, i) for i, m in enumerate(masks))
+    relations = dict((rel, []) for rel in RELATIONS)
+    for mask in masks:
+        entry = lattice[mask_to_grammar(mask, n)]
+        for rel in RELATIONS:
+            related = (index_of[grammar_to_mask(g, n)] for g in entry[rel])
+            relations[rel].append(sorted(related))
+    write_lattice(path, n, masks, relations)
+
+
+def _pack_array(code, values):
+    return struct.pack('<%d%s' % (len(values), code), *values)
+
+
+class MappedLattice(Mapping):
+    """Read-only stand-in for the pickled lattice dict.
+
+    Indexing with a frozenset grammar returns a LatticeEntry whose 'up',
+    'down' and 'max' values are sets of frozenset grammars, exactly like the
+    dicts in the old pickles, but decoded lazily from the mapped file.
+
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mm, 0)
+        if header[0] != MAGIC:
+            raise ValueError("%s is not a binary lattice file" % path)
+        self.n = header[1]
+        self._num_orders = header[2]
+        offsets = header[3:]
+        self._sections = dict(
+            (rel, (offsets[2 * i], offsets[2 * i + 1]))
+            for i, rel in enumerate(RELATIONS)
+        )
+
+    def __len__(self):
+        return self._num_orders
+
+    def __iter__(self):
+        for i in xrange(self._num_orders):
+            yield mask_to_grammar(self.mask(i), self.n)
+
+    def __contains__(self, grammar):
+        try:
+            self.index(grammar_to_mask(grammar, self.n))
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __getitem__(self, grammar):
+        try:
+            mask = grammar_to_mask(grammar, self.n)
+        except TypeError:
+            raise KeyError(grammar)
+        return LatticeEntry(self, self.index(mask))
+
+    def mask(self, i):
+        return _ORDER.unpack_from(self._mm, _HEADER.size + i * _ORDER.size)[0]
+
+    def index(self, mask):
+        """Binary search the sorted order array for a bitmask."""
+        lo, hi = 0, self._num_orders
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.mask(mid) < mask:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._num_orders or self.mask(lo) != mask:
+            raise KeyError(mask)
+        return lo
+
+    def related_indices(self, rel, i):
+        indptr_offset, data_offset = self._sections[rel]
+        start, end = struct.unpack_from('<2I', self._mm,
+                                        indptr_offset + i * _INDEX.size)
+        return struct.unpack_from('<%dI' % (end - start), self._mm,
+                                  data_offset + start * _INDEX.size)
+
+    def related_masks(self, rel, i):
+        return [self.mask(j) for j in self.related_indices(rel, i)]
+
+    def close(self):
+        self._mm.close()
+
+
+class LatticeEntry(Mapping):
+
+    def __init__(self, lattice, index):
+        self._lattice = lattice
+        self._index = index
+        self._decoded = {}
+
+    def __len__(self):
+        return len(RELATIONS)
+
+    def __iter__(self):
+        return iter(RELATIONS)
+
+    def __getitem__(self, rel):
+        if rel not in RELATIONS:
+            raise KeyError(rel)
+        try:
+            return self._decoded[rel]
+        except KeyError:
+            n = self._lattice.n
+            masks = self._lattice.related_masks(rel, self._index)
+            self._decoded[rel] = frozenset(mask_to_grammar(m, n)
+                                           for m in masks)
+            return self._decoded[rel]
@@ -0,0 +1,36 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A small least-recently-used cache for hot grammars."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = compute()
+            return self._data[key]
+
+    def clear(self):
+        self._data.clear()
@@ -0,0 +1,69 @@
+"""Bitmask encoding of grammars.
+
+A grammar is a frozenset of (lower, higher) pairs of 1-indexed constraints.
+Each ordered pair gets a fixed bit, so a grammar is a single integer and set
+operations become bitwise ones. Pairs are numbered by their larger
+constraint first, so the pairs over n constraints are a prefix of those over
+n + 1 and a grammar has the same mask whatever the size of its dataset. That
+mask doubles as the grammar's id in the database.
+
+"""
+# 8 * 7 pair bits still fit in a signed 64-bit BSON integer
+MAX_CONSTRAINTS = 8
+
+_pair_tables = {}
+
+
+def pairs(n):
+    """Return the ordered pairs over n constraints in bit order."""
+    return _pair_table(n)[0]
+
+
+def pair_bit(pair, n):
+    return _pair_table(n)[1][pair]
+
+
+def grammar_to_mask(grammar, n):
+    bits = _pair_table(n)[1]
+    mask = 0
+    for pair in grammar:
+        mask |= 1 << bits[pair]
+    return mask
+
+
+def mask_to_grammar(mask, n):
+    ordered_pairs = _pair_table(n)[0]
+    rels = []
+    bit = 0
+    while mask:
+        if mask & 1:
+            rels.append(ordered_pairs[bit])
+        mask >>= 1
+        bit += 1
+    return frozenset(rels)
+
+
+def grammar_id(grammar):
+    """Return the integer id of a frozenset grammar."""
+    return grammar_to_mask(grammar, MAX_CONSTRAINTS)
+
+
+def grammar_from_id(gid):
+    return mask_to_grammar(gid, MAX_CONSTRAINTS)
+
+
+def num_pairs(n):
+    return n * (n - 1)
+
+
+def _pair_table(n):
+    try:
+        return _pair_tables[n]
+    except KeyError:
+        ordered_pairs = []
+        for larger in xrange(2, n + 1):
+            for smaller in xrange(1, larger):
+                ordered_pairs.extend([(smaller, larger), (larger, smaller)])
+        bits = dict((p, b) for b, p in enumerate(ordered_pairs))
+        _pair_tables[n] = (ordered_pairs, bits)
+        return _pair_tables[n]
@@ -0,0 +1,57 @@
+"""Entailments between candidates.
+
+Candidate c entails c' when every grammar that makes c optimal also makes
+c' optimal. A partial order makes a candidate optimal when some total order
+extending it does, so this holds exactly when every total order under which
+c wins is one under which c' wins too. That is either a subset test on the
+bitsets of a WinnerTable, or, without enumerating any orders, a test that
+the ERCs under which c wins entail each ERC under which c' wins.
+
+Candidates that can never win are left out, rather than vacuously
+entailing everything.
+
+"""
+from ercs import candidate_ercs, grammar_ercs, consistent, entails
+
+
+def bitset_entailments(table, mask=0):
+    """Map each candidate key to the keys of the candidates it entails.
+
+    Only total orders extending the grammar with this mask (the a priori
+    ranking) are considered. Every candidate that can win entails itself.
+
+    """
+    extensions = table.orders.extensions(mask)
+    wins = {}
+    for key, cand_wins in table.wins.iteritems():
+        if cand_wins & extensions:
+            wins[key] = cand_wins & extensions
+    return dict(
+        (key, [other for other, other_wins in wins.iteritems()
+               if not cand_wins & ~other_wins])
+        for key, cand_wins in wins.iteritems()
+    )
+
+
+def erc_entailments(candidates, n, apriori=frozenset(), progress=None):
+    """Same as bitset_entailments, but from the candidates' ERCs.
+
+    Each test is a handful of RCD runs, so this takes time polynomial in
+    the number of constraints and candidates rather than n!. If given,
+    progress is called with the number of candidates done and the total.
+
+    """
+    apriori_ercs = grammar_ercs(apriori)
+    ercs = {}
+    for key, cand_ercs in candidate_ercs(candidates, n).iteritems():
+        if consistent(cand_ercs + apriori_ercs, n):
+            ercs[key] = cand_ercs + apriori_ercs
+    entailments = {}
+    for key, cand_ercs in ercs.iteritems():
+        entailments[key] = [
+            other for other, other_ercs in ercs.iteritems()
+            if all(entails(cand_ercs, erc, n) for erc in other_ercs)
+        ]
+        if progress is not None:
+            progress(len(entailments), len(ercs))
+    return entailments
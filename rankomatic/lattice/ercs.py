@@ -0,0 +1,89 @@
+"""Elementary ranking conditions.
+
+An ERC is a (W, L) pair of constraint bitmasks, bit c - 1 standing for
+constraint c. It holds of a total order when some constraint in W dominates
+every constraint in L. A set of ERCs is consistent exactly when Recursive
+Constraint Demotion can rank every constraint, which takes polynomial time.
+
+"""
+
+
+def candidate_ercs(candidates, n):
+    """Map each candidate key to the ERCs under which it beats its rivals.
+
+    Candidates are the ot-compatible dicts used by OTStats. Rivals with the
+    same violation vector tie rather than compete, so they add no ERC.
+
+    """
+    by_input = {}
+    for cand in candidates:
+        by_input.setdefault(cand['input'], []).append(cand)
+    ercs = {}
+    for inp, group in by_input.iteritems():
+        for cand in group:
+            ercs[candidate_key(cand)] = [
+                erc(cand['violation_vector'], rival['violation_vector'], n)
+                for rival in group
+                if rival['violation_vector'] != cand['violation_vector']
+            ]
+    return ercs
+
+
+def candidate_key(cand):
+    return (cand['input'], cand['output'])
+
+
+def erc(winner_vvec, loser_vvec, n):
+    winners = losers = 0
+    for c in xrange(1, n + 1):
+        if winner_vvec[c] < loser_vvec[c]:
+            winners |= 1 << (c - 1)
+        elif winner_vvec[c] > loser_vvec[c]:
+            losers |= 1 << (c - 1)
+    return (winners, losers)
+
+
+def grammar_ercs(grammar):
+    """One ERC per (lower, higher) pair: higher dominates lower."""
+    return [(1 << (hi - 1), 1 << (lo - 1)) for lo, hi in grammar]
+
+
+def consistent(ercs, n):
+    """Run Recursive Constraint Demotion, True if it ranks everything."""
+    remaining = [e for e in ercs if e[1]]
+    unranked = (1 << n) - 1
+    while remaining:
+        demoted = 0
+        for winners, losers in remaining:
+            demoted |= losers
+        stratum = unranked & ~demoted
+        if not stratum:
+            return False
+        unranked &= ~stratum
+        remaining = [e for e in remaining if not e[0] & stratum]
+    return True
+
+
+def entails(ercs, target, n):
+    """True if every total order satisfying ercs also satisfies target.
+
+    target fails exactly when some loser of it dominates all of its
+    winners, so it is entailed when each such ranking contradicts ercs.
+
+    """
+    winners, losers = target
+    for loser in _constraints(losers):
+        counterexample = [(1 << (loser - 1), 1 << (w - 1))
+                          for w in _constraints(winners)]
+        if consistent(ercs + counterexample, n):
+            return False
+    return True
+
+
+def _constraints(subset):
+    c = 1
+    while subset:
+        if subset & 1:
+            yield c
+        subset >>= 1
+        c += 1
@@ -0,0 +1,102 @@
+"""Counting the total orders (linear extensions) above a grammar.
+
+The number of total orders extending a grammar is its rank volume, and the
+number of those under which a candidate wins is its COT count, so neither
+needs the materialized 'max' sets of a lattice.
+
+"""
+from cache import LRUCache
+from encoding import pairs
+from ercs import candidate_ercs
+
+DEFAULT_CACHE_SIZE = 4096
+
+_counters = {}
+
+
+def count_linear_extensions(grammar, n):
+    """Count the total orders over n constraints that extend grammar.
+
+    dp[S] is the number of ways to rank the constraints in S above all the
+    others. A constraint can join S once every constraint dominating it
+    already has, so the count for the whole set is the rank volume.
+
+    """
+    dominators = [0] * n
+    for lo, hi in grammar:
+        dominators[lo - 1] |= 1 << (hi - 1)
+    return _count(dominators, n, [])
+
+
+def _count(dominators, n, ercs):
+    """Run the subset DP, only ranking orders that satisfy every ERC.
+
+    Constraints are ranked from the top down. An ERC holds when one of its
+    winners is ranked before any of its losers, so a loser may only join S
+    once S already holds a winner of each ERC it loses.
+
+    """
+    blockers = [[w for w, l in ercs if l & 1 << c] for c in xrange(n)]
+    dp = [0] * (1 << n)
+    dp[0] = 1
+    for ranked in xrange(1 << n):
+        if not dp[ranked]:
+            continue
+        for c in xrange(n):
+            bit = 1 << c
+            if (not ranked & bit and dominators[c] & ~ranked == 0 and
+                    all(w & ranked for w in blockers[c])):
+                dp[ranked | bit] += dp[ranked]
+    return dp[-1]
+
+
+def linear_extensions(n):
+    """Return the shared LinearExtensions counter for n constraints."""
+    try:
+        return _counters[n]
+    except KeyError:
+        _counters[n] = LinearExtensions(n)
+        return _counters[n]
+
+
+class LinearExtensions(object):
+    """Linear extension counts over n constraints, memoized by grammar mask.
+
+    Masks are the pair bitmasks of lattice.encoding, i.e. grammar ids.
+
+    """
+
+    def __init__(self, n, cache_size=DEFAULT_CACHE_SIZE):
+        self.n = n
+        self._pairs = pairs(n)
+        self._cache = LRUCache(cache_size)
+
+    def count(self, mask):
+        """Return the rank volume of the grammar with this mask."""
+        return self._cache.get_or_compute(
+            mask, lambda: _count(self._dominators(mask), self.n, [])
+        )
+
+    def num_cots_by_cand(self, candidates, mask):
+        """Map each candidate key to the total orders above mask it wins.
+
+        Candidates are the ot-compatible dicts used by OTStats, and keys are
+        (input, output) pairs as in OTStats.num_cots_by_cand.
+
+        """
+        dominators = self._dominators(mask)
+        return dict(
+            (key, _count(dominators, self.n, ercs))
+            for key, ercs in candidate_ercs(candidates, self.n).iteritems()
+        )
+
+    def _dominators(self, mask):
+        dominators = [0] * self.n
+        bit = 0
+        while mask:
+            if mask & 1:
+                lo, hi = self._pairs[bit]
+                dominators[lo - 1] |= 1 << (hi - 1)
+            mask >>= 1
+            bit += 1
+        return dominators
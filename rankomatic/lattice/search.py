@@ -0,0 +1,152 @@
+"""Compatible-grammar search for constraint counts without a lattice.
+
+Rather than testing every grammar in a precomputed lattice, strict orders
+are grown one constraint at a time (see space.strict_orders) and a branch is
+abandoned as soon as no completion of it can be compatible:
+
+  * every optimal candidate must still win under some ranking, and
+  * some ranking must make an optimal candidate win for every input.
+
+Both are ERC consistency tests on the pairs placed so far plus the a priori
+ranking. Only the grammars that pass are held in memory.
+
+Each branch is given an equal share of its parent's, so the shares of the
+branches finished so far estimate how much of the search is done.
+
+"""
+from ercs import candidate_ercs, candidate_key, grammar_ercs, consistent
+from encoding import pair_bit, mask_to_grammar
+from space import closed_subsets, elements
+
+# report progress after this many branches are finished
+PROGRESS_STEPS = 256
+
+
+class CompatibleGrammarSearch(object):
+
+    def __init__(self, candidates, n, apriori=frozenset(), classical=False,
+                 progress=None):
+        self.n = n
+        self.classical = classical
+        self.apriori = apriori
+        self.progress = progress
+        self.scanned = 0.0
+        self.found = 0
+        self._steps = 0
+        self._apriori_ercs = grammar_ercs(apriori)
+        ercs = candidate_ercs(candidates, n)
+        optimal = [candidate_key(c) for c in candidates if c['optimal']]
+        losing = [candidate_key(c) for c in candidates if not c['optimal']]
+        self._optimal_ercs = [ercs[key] for key in optimal]
+        self._losing_ercs = [ercs[key] for key in losing]
+        self._winner_choices = self._group_optimal_by_input(candidates, ercs)
+
+    def _group_optimal_by_input(self, candidates, ercs):
+        choices = {}
+        for cand in candidates:
+            if cand['optimal']:
+                choices.setdefault(cand['input'], []).append(
+                    ercs[candidate_key(cand)])
+        inputs = [c['input'] for c in candidates]
+        return [choices.get(inp, []) for inp in sorted(set(inputs))]
+
+    def grammars(self):
+        """Generate every compatible grammar as a frozenset of pairs.
+
+        If given, progress is called now and then with the fraction of the
+        search done and the number of grammars found so far.
+
+        """
+        below = [0] * (self.n + 1)
+        above = [0] * (self.n + 1)
+        for mask, rel_ercs in self._extend(0, below, above, 0, [], 1.0):
+            if self._no_loser_can_win(rel_ercs):
+                self.found += 1
+                yield mask_to_grammar(mask, self.n)
+        if self.progress is not None:
+            self.progress(1.0, self.found)
+
+    def _extend(self, k, below, above, mask, rel_ercs, share):
+        if not self._can_be_compatible(rel_ercs):
+            self._finish_branch(share)
+            return
+        if k == self.n:
+            self._finish_branch(share)
+            yield mask, rel_ercs
+            return
+        new = k + 1
+        placed = (1 << k) - 1
+        children = list(self._children(new, placed, below, above))
+        if not children:
+            self._finish_branch(share)
+        for lower, upper in children:
+            new_pairs = ([(e, new) for e in elements(lower)] +
+                         [(new, e) for e in elements(upper)])
+            new_mask = mask
+            for pair in new_pairs:
+                new_mask |= 1 << pair_bit(pair, self.n)
+            for e in elements(lower):
+                above[e] |= 1 << k
+            for e in elements(upper):
+                below[e] |= 1 << k
+            below[new], above[new] = lower, upper
+            extended = self._extend(new, below, above, new_mask,
+                                    rel_ercs + grammar_ercs(new_pairs),
+                                    share / len(children))
+            for result in extended:
+                yield result
+            for e in elements(lower):
+                above[e] &= ~(1 << k)
+            for e in elements(upper):
+                below[e] &= ~(1 << k)
+            below[new] = above[new] = 0
+
+    def _children(self, new, placed, below, above):
+        """The (lower, upper) sets constraint new can be placed between."""
+        for lower in closed_subsets(placed, below):
+            common = placed & ~lower
+            for e in elements(lower):
+                common &= above[e]
+            for upper in closed_subsets(common, above):
+                if self.classical and lower | upper != placed:
+                    continue
+                if self._respects_apriori(new, lower, upper):
+                    yield lower, upper
+
+    def _finish_branch(self, share):
+        self.scanned += share
+        self._steps += 1
+        if self.progress is not None and not self._steps % PROGRESS_STEPS:
+            self.progress(self.scanned, self.found)
+
+    def _respects_apriori(self, new, lower, upper):
+        for lo, hi in self.apriori:
+            if hi == new and lo < new and not lower >> (lo - 1) & 1:
+                return False
+            if lo == new and hi < new and not upper >> (hi - 1) & 1:
+                return False
+        return True
+
+    def _can_be_compatible(self, rel_ercs):
+        known = rel_ercs + self._apriori_ercs
+        for ercs in self._optimal_ercs:
+            if not consistent(known + ercs, self.n):
+                return False
+        return self._some_ranking_picks_optimal(known, 0)
+
+    def _some_ranking_picks_optimal(self, known, i):
+        if i == len(self._winner_choices):
+            return True
+        for ercs in self._winner_choices[i]:
+            chosen = known + ercs
+            if (consistent(chosen, self.n) and
+                    self._some_ranking_picks_optimal(chosen, i + 1)):
+                return True
+        return False
+
+    def _no_loser_can_win(self, rel_ercs):
+        for ercs in self._losing_ercs:
+            if consistent(rel_ercs + ercs, self.n):
+                return False
+        return True
+
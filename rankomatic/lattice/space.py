@@ -0,0 +1,205 @@
+"""Lattice-free up/down/max queries over the space of strict orders.
+
+Only the sorted array of every strict order over n constraints is kept, as
+pair bitmasks. For each of the n(n-1) pair bits there is also a bit-slice: a
+Python long with bit i set when order i contains that pair. The up-set of a
+grammar is the AND of the slices of its pairs, the down-set is everything
+outside the OR of the remaining slices, and max is the up-set restricted to
+total orders, so every query is a handful of whole-array bitwise operations
+instead of a walk over a stored lattice.
+
+"""
+from array import array
+from collections import Mapping
+
+from binary import LatticeEntry
+from cache import LRUCache
+from encoding import pairs, pair_bit, grammar_to_mask, mask_to_grammar
+
+DEFAULT_CACHE_SIZE = 4096
+
+# number of strict orders over n labelled constraints, indexed by n
+NUM_STRICT_ORDERS = [1, 1, 3, 19, 219, 4231, 130023, 6129859, 431723379]
+
+
+def strict_orders(n):
+    """Generate the pair bitmask of every strict order over n constraints.
+
+    Orders are built one constraint at a time. The constraints placed below
+    the new one must form a down-set and those placed above it an up-set
+    that already lies entirely above the down-set, which yields each
+    labelled order exactly once and keeps every partial result transitive.
+
+    """
+    below = [0] * (n + 1)
+    above = [0] * (n + 1)
+    return _extend_orders(n, 0, below, above, 0)
+
+
+def _extend_orders(n, k, below, above, mask):
+    if k == n:
+        yield mask
+        return
+    new = k + 1
+    placed = (1 << k) - 1
+    for lower in closed_subsets(placed, below):
+        common = placed & ~lower
+        for e in elements(lower):
+            common &= above[e]
+        for upper in closed_subsets(common, above):
+            new_mask = mask
+            for e in elements(lower):
+                above[e] |= 1 << k
+                new_mask |= 1 << pair_bit((e, new), n)
+            for e in elements(upper):
+                below[e] |= 1 << k
+                new_mask |= 1 << pair_bit((new, e), n)
+            below[new], above[new] = lower, upper
+            for order in _extend_orders(n, new, below, above, new_mask):
+                yield order
+            for e in elements(lower):
+                above[e] &= ~(1 << k)
+            for e in elements(upper):
+                below[e] &= ~(1 << k)
+            below[new] = above[new] = 0
+
+
+def closed_subsets(allowed, closure):
+    """Subsets of allowed that contain closure[e] for each of their e."""
+    subset = allowed
+    while True:
+        if all(closure[e] & ~subset == 0 for e in elements(subset)):
+            yield subset
+        if subset == 0:
+            return
+        subset = (subset - 1) & allowed
+
+
+def elements(subset):
+    e = 1
+    while subset:
+        if subset & 1:
+            yield e
+        subset >>= 1
+        e += 1
+
+
+def bit_indices(bitset):
+    """Return the positions of the set bits of a long, ascending."""
+    bits = bin(bitset)[:1:-1]
+    indices = []
+    i = bits.find('1')
+    while i != -1:
+        indices.append(i)
+        i = bits.find('1', i + 1)
+    return indices
+
+
+def popcount(bitset):
+    return bin(bitset).count('1')
+
+
+class OrderSpace(Mapping):
+    """Answers lattice queries from the flat array of strict orders.
+
+    Behaves like MappedLattice, so it can stand in for OTStats._lattice for
+    constraint counts that have no precomputed lattice file.
+
+    """
+
+    def __init__(self, n, masks=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.n = n
+        if masks is None:
+            masks = sorted(strict_orders(n))
+        self._masks = array('L', masks)
+        self._index = dict((m, i) for i, m in enumerate(self._masks))
+        self._all = (1 << len(self._masks)) - 1
+        self._build_slices()
+        self._cache = LRUCache(cache_size)
+
+    def _build_slices(self):
+        num_orders = len(self._masks)
+        total_size = self.n * (self.n - 1) // 2
+        slices = []
+        for bit in xrange(len(pairs(self.n))):
+            digits = ['0'] * num_orders
+            for i, mask in enumerate(self._masks):
+                if mask >> bit & 1:
+                    digits[num_orders - 1 - i] = '1'
+            slices.append(long(''.join(digits), 2))
+        self._slices = slices
+        digits = ['0'] * num_orders
+        for i, mask in enumerate(self._masks):
+            if popcount(mask) == total_size:
+                digits[num_orders - 1 - i] = '1'
+        self._total = long(''.join(digits), 2)
+
+    def __len__(self):
+        return len(self._masks)
+
+    def __iter__(self):
+        for mask in self._masks:
+            yield mask_to_grammar(mask, self.n)
+
+    def __contains__(self, grammar):
+        try:
+            return grammar_to_mask(grammar, self.n) in self._index
+        except (KeyError, TypeError):
+            return False
+
+    def __getitem__(self, grammar):
+        try:
+            mask = grammar_to_mask(grammar, self.n)
+        except TypeError:
+            raise KeyError(grammar)
+        return LatticeEntry(self, self.index(mask))
+
+    def mask(self, i):
+        return self._masks[i]
+
+    def index(self, mask):
+        return self._index[mask]
+
+    def related_indices(self, rel, i):
+        return self._cache.get_or_compute(
+            (rel, i), lambda: tuple(bit_indices(self.related(rel, i)))
+        )
+
+    def related_masks(self, rel, i):
+        return [self._masks[j] for j in self.related_indices(rel, i)]
+
+    def related(self, rel, i):
+        """Return the bitset of orders related to order i by rel."""
+        mask = self._masks[i]
+        if rel == 'up':
+            return self.supersets(mask)
+        elif rel == 'down':
+            return self.subsets(mask)
+        elif rel == 'max':
+            return self.supersets(mask) & self._total
+        raise KeyError(rel)
+
+    def supersets(self, mask):
+        result = self._all
+        for bit in _set_bits(mask):
+            result &= self._slices[bit]
+        return result
+
+    def subsets(self, mask):
+        outside = 0
+        for bit in xrange(len(self._slices)):
+            if not mask >> bit & 1:
+                outside |= self._slices[bit]
+        return self._all & ~outside
+
+    def count(self, rel, i):
+        return popcount(self.related(rel, i))
+
+
+def _set_bits(mask):
+    bit = 0
+    while mask:
+        if mask & 1:
+            yield bit
+        mask >>= 1
+        bit += 1
@@ -0,0 +1,113 @@
+"""Which candidates win under which total orders.
+
+The n! total orders over n constraints are numbered once per n, and for each
+ordered pair there is a bit-slice: a Python long with bit i set when total
+order i ranks the pair's higher constraint above its lower one. A winner
+table turns each candidate's ERCs into the bitset of total orders under
+which it wins, using only ANDs and ORs of those slices, so COT counts over
+any grammar are a mask and a popcount.
+
+"""
+from itertools import permutations
+
+from encoding import pairs, pair_bit
+from ercs import candidate_ercs
+from space import popcount
+
+_total_orders = {}
+
+
+def total_orders(n):
+    """Return the shared TotalOrders for n constraints."""
+    try:
+        return _total_orders[n]
+    except KeyError:
+        _total_orders[n] = TotalOrders(n)
+        return _total_orders[n]
+
+
+class TotalOrders(object):
+    """Bit-slices of the total orders over n constraints."""
+
+    def __init__(self, n):
+        self.n = n
+        self.orders = list(permutations(xrange(1, n + 1)))
+        self.all = (1 << len(self.orders)) - 1
+        self._build_slices()
+
+    def _build_slices(self):
+        num_orders = len(self.orders)
+        digits = [['0'] * num_orders for pair in pairs(self.n)]
+        for i, order in enumerate(self.orders):
+            position = num_orders - 1 - i
+            for hi_pos, hi in enumerate(order):
+                for lo in order[hi_pos + 1:]:
+                    digits[pair_bit((lo, hi), self.n)][position] = '1'
+        self._slices = [long(''.join(d), 2) for d in digits]
+
+    def __len__(self):
+        return len(self.orders)
+
+    def ranked_above(self, hi, lo):
+        """Bitset of the total orders ranking constraint hi above lo."""
+        return self._slices[pair_bit((lo, hi), self.n)]
+
+    def extensions(self, mask):
+        """Bitset of the total orders extending the grammar with this mask."""
+        result = self.all
+        bit = 0
+        while mask:
+            if mask & 1:
+                result &= self._slices[bit]
+            mask >>= 1
+            bit += 1
+        return result
+
+    def satisfying(self, erc):
+        """Bitset of the total orders in which the ERC holds."""
+        winners, losers = erc
+        result = 0
+        for w in _constraints(winners):
+            dominates = self.all
+            for l in _constraints(losers):
+                dominates &= self.ranked_above(w, l)
+            result |= dominates
+        return result if losers else self.all
+
+
+class WinnerTable(object):
+    """For every candidate, the bitset of total orders under which it wins.
+
+    Built once per dataset from the ot-compatible candidate dicts. Keys are
+    (input, output) pairs as in OTStats.num_cots_by_cand.
+
+    """
+
+    def __init__(self, candidates, n):
+        self.n = n
+        self.orders = total_orders(n)
+        self.wins = {}
+        for key, ercs in candidate_ercs(candidates, n).iteritems():
+            wins = self.orders.all
+            for erc in ercs:
+                wins &= self.orders.satisfying(erc)
+            self.wins[key] = wins
+
+    def count(self, mask):
+        """Number of total orders extending the grammar with this mask."""
+        return popcount(self.orders.extensions(mask))
+
+    def num_cots_by_cand(self, mask):
+        """Map each candidate key to the total orders above mask it wins."""
+        extensions = self.orders.extensions(mask)
+        return dict((key, popcount(wins & extensions))
+                    for key, wins in self.wins.iteritems())
+
+
+def _constraints(subset):
+    c = 1
+    while subset:
+        if subset & 1:
+            yield c
+        subset >>= 1
+        c += 1
@@ -13,9 +13,12 @@ Candidate: A single row from the Dataset, in OT terms an input-outuput pair.
 Dataset: Represents a user's tableaux or dataset. Consists of a list of
           constraint names and a list of Candidates.
 User: A user of the website.
+Job: A calculation requested of the worker daemon, and its state.
 """
 import dataset
+import job
 import user
 
 Dataset = dataset.Dataset
+Job = job.Job
 User = user.User
@@ -1,15 +1,40 @@
 import datetime
-import gridfs
+import hashlib
 import json
-import urllib
+import math
 from collections import defaultdict
 
 from candidate import Candidate
 from grammar import Grammar, GrammarList
+from results import CachedResult, MAX_CACHED_GRAMMARS
 from rankomatic import db
 from ot.poot import OTStats
+from rankomatic.lattice.cache import LRUCache
+from rankomatic.lattice.encoding import grammar_id, grammar_from_id
+from rankomatic.lattice.entailments import bitset_entailments, erc_entailments
+from rankomatic.lattice.extensions import linear_extensions
+from rankomatic.lattice.search import CompatibleGrammarSearch
+from rankomatic.lattice.space import NUM_STRICT_ORDERS, popcount
+from rankomatic.lattice.winners import WinnerTable
 from util import DatasetConverter, pair_to_string
-from graphs import EntailmentGraph
+from graphs import (EntailmentGraph, LAST_ACCESS_RESOLUTION,
+                    remove_dataset_graphs, visualize_all)
+
+# beyond this, grammars are searched for instead of read from a lattice
+MAX_LATTICE_CONSTRAINTS = 4
+# beyond this, entailments come from ERCs instead of enumerating total orders
+MAX_BITSET_ENTAILMENT_CONSTRAINTS = 5
+WINNER_TABLE_CACHE_SIZE = 32
+# guest datasets not accessed for this long are removed by the sweeper
+GUEST_DATASET_TTL = datetime.timedelta(days=1)
+# the examples every user starts with, which never expire
+PROTECTED_DATASETS = ["Kiparsky", "CV Syllabification"]
+
+_winner_tables = LRUCache(WINNER_TABLE_CACHE_SIZE)
+
+
+def _ignore_progress(stage, **counts):
+    pass
 
 
 class Dataset(db.Document):
@@ -20,6 +45,7 @@ class Dataset(db.Document):
 
     """
     upload_date = db.DateTimeField(default=datetime.datetime.utcnow())
+    last_access = db.DateTimeField(default=datetime.datetime.utcnow)
     name = db.StringField(max_length=255, required=True, unique_with='user')
     constraints = db.ListField(db.StringField(max_length=255, required=True),
                                default=lambda: ["" for x in range(3)])
@@ -42,11 +68,17 @@ class Dataset(db.Document):
     entailments_calculated = db.BooleanField(default=False)
     entailments_visualized = db.BooleanField(default=False)
 
+    meta = {'indexes': [('user', 'last_access')]}
+
     @property
     def raw_grammars(self):
+        return [grammar_from_id(gid) for gid in self.grammar_ids]
+
+    @property
+    def grammar_ids(self):
         if self.grammars is None:
             self.calculate_compatible_grammars()
-        return [gram.raw_grammar for gram in self.grammars]
+        return self._grammars.grammar_ids()
 
     @property
     def grammars(self):
@@ -79,7 +111,6 @@ class Dataset(db.Document):
     def sort_by(self, value):
         if value and self._sort_by != value:
             self.grammars = None
-            self.remove_old_files()
             self._sort_by = value
 
     @property
@@ -101,6 +132,12 @@ class Dataset(db.Document):
 
         # stores candidates in ot-compatible form
         self._ot_candidates = None
+        self._winner_table = None
+        # called with the stage and counts of long calculations as they go
+        self.progress = _ignore_progress
+        # cleared when the poot has no lattice to read, so grammars are
+        # searched for whatever the number of constraints
+        self.lattice_available = True
         self._initialize_dset(data, data_is_from_form)
 
         # self.candidates is non-empty if retrieved from DB
@@ -126,6 +163,7 @@ class Dataset(db.Document):
         """From ot library form, set the corresponding fields"""
         self.name = data['name']
         self._ot_candidates = data['candidates']
+        self._winner_table = None
         self.constraints = data['constraints']
         self.candidates = [Candidate(cand) for cand in data['candidates']]
         try:
@@ -156,33 +194,73 @@ class Dataset(db.Document):
     def grammar_to_json(self, index):
         return json.dumps(self.grammars[index].list_grammar)
 
+    def content_hash(self, apriori=True):
+        """Hash everything the computed results depend on.
+
+        Copies of a tableau hash the same whatever their name or owner, so
+        they can share CachedResults. Leave out the a priori ranking for
+        results that don't depend on it.
+
+        """
+        content = {
+            'constraints': self.constraints,
+            'candidates': sorted([c.input, c.output, c.optimal,
+                                  c.violation_vector]
+                                 for c in self.candidates),
+            'classical': self.classical
+        }
+        if apriori:
+            content['apriori'] = sorted(self.apriori_ranking.raw_grammar)
+        return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
     def calculate_entailments(self):
+        """Calculate global and a priori entailments.
+
+        Global entailments don't depend on the a priori ranking, so they
+        are cached separately and only the a priori entailments are
+        recalculated when it changes.
+
+        """
         if not self.entailments_calculated:
-            if self.apriori_ranking.list_grammar:
-                self._calculate_apriori_entailments()
-            else:
-                self._calculate_global_entailments()
+            self._load_or_calculate_global_entailments()
+            self._load_or_calculate_apriori_entailments()
             self.entailments_calculated = True
             self.save()
 
+    def _load_or_calculate_global_entailments(self):
+        cached = CachedResult.lookup(self, 'global_entailments')
+        if cached is not None:
+            self.global_entailments = cached
+        else:
+            self._calculate_global_entailments()
+            CachedResult.store(self, 'global_entailments',
+                               self.global_entailments)
+
+    def _load_or_calculate_apriori_entailments(self):
+        if not self.apriori_ranking.list_grammar:
+            self.apriori_entailments = {}
+            return
+        cached = CachedResult.lookup(self, 'apriori_entailments')
+        if cached is not None:
+            self.apriori_entailments = cached
+        else:
+            self._calculate_apriori_entailments()
+            CachedResult.store(self, 'apriori_entailments',
+                               self.apriori_entailments)
+
     def _calculate_apriori_entailments(self):
-        apriori_entailments = self.poot.get_entailments()
+        apriori_entailments = self._entailments(
+            self.apriori_ranking.raw_grammar
+        )
         apriori_entailments = self._process_entailments(apriori_entailments)
-        self._calculate_global_entailments()
         self._subtract_global_entailments(apriori_entailments)
 
     def _process_entailments(self, entailments):
         return {k: v for k, v in self._entailment_strings(entailments)}
 
     def _entailment_strings(self, entailments):
-        for old in entailments:
-            key = self._frozenset_to_string(old)
-            entailed = entailments[old]['up']
-            val = sorted([self._frozenset_to_string(e) for e in entailed])
-            yield key, val
-
-    def _frozenset_to_string(self, fset):
-        return pair_to_string(tuple(fset)[0])
+        for cand, entailed in entailments.iteritems():
+            yield pair_to_string(cand), sorted(map(pair_to_string, entailed))
 
     def _subtract_global_entailments(self, apriori_entailments):
         apriori_only_entailments = defaultdict(lambda: [])
@@ -193,22 +271,38 @@ class Dataset(db.Document):
         self.apriori_entailments = dict(apriori_only_entailments)
 
     def _calculate_global_entailments(self):
-        global_entailments = self.poot.get_entailments(apriori=frozenset([]))
+        global_entailments = self._entailments()
         self.global_entailments = self._process_entailments(global_entailments)
 
+    def _entailments(self, apriori=frozenset()):
+        stage = 'apriori_entailments' if apriori else 'global_entailments'
+        num_constraints = len(self.constraints)
+        if num_constraints <= MAX_BITSET_ENTAILMENT_CONSTRAINTS:
+            entailments = bitset_entailments(self.winner_table(),
+                                             grammar_id(apriori))
+            self.progress(stage, done=len(entailments),
+                          total=len(entailments))
+            return entailments
+        return erc_entailments(
+            self._ot_candidates or [], num_constraints, apriori,
+            progress=lambda done, total: self.progress(stage, done=done,
+                                                       total=total)
+        )
+
     def visualize_and_store_entailments(self):
         num_cots_by_cand = self._process_num_cots_by_cand()
         graph = EntailmentGraph(self.global_entailments,
                                 self.apriori_entailments,
                                 self.name,
-                                num_cots_by_cand)
+                                num_cots_by_cand,
+                                dset_id=self.id)
         graph.visualize()
         self.entailments_visualized = True
         self.save()
 
     def _process_num_cots_by_cand(self):
-        num_cots_by_cand = self.poot.num_cots_by_cand(
-            self.apriori_ranking.raw_grammar
+        num_cots_by_cand = self.winner_table().num_cots_by_cand(
+            grammar_id(self.apriori_ranking.raw_grammar)
         )
         return {pair_to_string(k): v for k, v in num_cots_by_cand.iteritems()}
 
@@ -220,53 +314,142 @@ class Dataset(db.Document):
         """
         if not self.id:
             self.save()
-        grammars = list(self.poot.get_grammars(classical=self.classical))
-        grammars.sort(key=self.get_grammar_sorter())
-        self.grammars = [Grammar(gram, self) for gram in grammars]
+        gram_ids = CachedResult.lookup(self, 'grammars', self._sort_by)
+        if gram_ids is None:
+            gram_ids = self._sorted_compatible_grammar_ids()
+            if len(gram_ids) <= MAX_CACHED_GRAMMARS:
+                CachedResult.store(self, 'grammars', gram_ids, self._sort_by)
+        self.grammars = Grammar.from_ids(gram_ids, self)
+
+    def _sorted_compatible_grammar_ids(self):
+        gram_ids = [grammar_id(g) for g in self._find_compatible_grammars()]
+        gram_ids.sort(key=self.get_grammar_sorter())
+        return gram_ids
+
+    def _find_compatible_grammars(self):
+        if self.uses_lattice():
+            grammars = self.poot.get_grammars(classical=self.classical)
+            self.progress('grammars', scanned=1.0, found=len(grammars))
+            return grammars
+        search = CompatibleGrammarSearch(
+            self._ot_candidates or [], len(self.constraints),
+            apriori=self.apriori_ranking.raw_grammar,
+            classical=self.classical,
+            progress=lambda scanned, found: self.progress(
+                'grammars', scanned=scanned, found=found
+            )
+        )
+        return search.grammars()
+
+    def uses_lattice(self):
+        return (self.lattice_available and
+                len(self.constraints) <= MAX_LATTICE_CONSTRAINTS)
 
     def get_grammar_sorter(self):
+        """Return a sort key over grammar ids."""
         if self._sort_by == 'size':
-            return len
+            return popcount
         else:  # default is 'rank_volume':
             return self.get_rank_volume_sorter()
 
     def get_rank_volume_sorter(self):
-        lattice = self.poot.lattice
+        return self.rank_volumes().count
+
+    def rank_volumes(self):
+        """The memoized linear extension counter for this dataset's size."""
+        return linear_extensions(len(self.constraints))
+
+    def winner_table(self):
+        """The winning candidates under every total order.
 
-        def rank_volume_sorter(grammar):
-            return len(lattice[grammar]['max'])
+        Built once per content version and shared by every dataset in the
+        process with the same candidates, whatever its a priori ranking.
 
-        return rank_volume_sorter
+        """
+        if self._winner_table is None:
+            self._winner_table = _winner_tables.get_or_compute(
+                self.content_hash(apriori=False),
+                lambda: WinnerTable(self._ot_candidates or [],
+                                    len(self.constraints))
+            )
+        return self._winner_table
 
     def visualize_and_store_grammars(self, inds):
         """Generate visualization images and store them in GridFS"""
-        [self.grammars[i].visualize(self.name, i) for i in inds]
+        visualize_all(
+            [self.grammars[i].graph() for i in inds],
+            progress=lambda done, total: self.progress('graphs', done=done,
+                                                       total=total)
+        )
         self.save()
 
     def remove_old_files(self):
-        fs = gridfs.GridFS(db.get_pymongo_db(), collection='tmp')
-        encode_name = urllib.quote(self.name)
-        filenames = [f for f in fs.list() if encode_name in f]
-        for filename in filenames:
-            last_version = fs.get_last_version(filename)
-            file_id = last_version._id
-            fs.delete(file_id)
-
-    def get_cot_stats_by_cand(self, grammar):
+        """Remove the graphs stored for this dataset."""
+        if self.id is not None:
+            remove_dataset_graphs([self.id])
+
+    def touch(self):
+        """Record an access, at most once per LAST_ACCESS_RESOLUTION."""
+        now = datetime.datetime.utcnow()
+        if self.id is None:
+            return
+        if (self.last_access is not None and
+                now - self.last_access < LAST_ACCESS_RESOLUTION):
+            return
+        Dataset.objects(id=self.id).update_one(set__last_access=now)
+        self.last_access = now
+
+    @classmethod
+    def remove_expired(cls, now=None):
+        """Remove the guest datasets not accessed within GUEST_DATASET_TTL.
+
+        Only their ids and grammar lists are loaded, and the datasets, the
+        lists and the graphs are each removed with one delete. Returns the
+        number of datasets removed.
+
+        Datasets saved before accesses were recorded are counted as
+        accessed now. They load with a fresh default, so touch() never
+        records their accesses, and they would otherwise be removed even
+        while in use.
+
+        """
+        now = now or datetime.datetime.utcnow()
+        collection = cls._get_collection()
+        collection.update({'last_access': {'$exists': False}},
+                          {'$set': {'last_access': now}}, multi=True)
+        expired = list(collection.find({
+            'user': 'guest',
+            'name': {'$nin': PROTECTED_DATASETS},
+            'last_access': {'$lt': now - GUEST_DATASET_TTL}
+        }, fields=['_grammars']))
+        if not expired:
+            return 0
+        dset_ids = [dset['_id'] for dset in expired]
+        list_ids = [dset['_grammars'] for dset in expired
+                    if dset.get('_grammars') is not None]
+        remove_dataset_graphs(dset_ids)
+        if list_ids:
+            GrammarList.objects(id__in=list_ids).delete()
+        cls.objects(id__in=dset_ids).delete()
+        return len(dset_ids)
+
+    def get_cot_stats_by_cand(self, gid):
         """For each input, return a list of dicts with output and COT stats.
 
-        Given a grammar, return a dict from each input to a list. In the list
-        is a dict for each output for that input, which contains the numbers
-        and percentages of COT grammars that make that candidate optimal.
+        Given a grammar id, return a dict from each input to a list. In the
+        list is a dict for each output for that input, which contains the
+        numbers and percentages of COT grammars that make that candidate
+        optimal.
 
         """
-        self._initialize_stats_for_grammar(grammar)
+        self._initialize_stats_for_grammar(gid)
         inputs = self._get_inputs_for_grammar()
         return {inp: self._make_input_cot_stats(inp) for inp in inputs}
 
-    def _initialize_stats_for_grammar(self, grammar):
-        self._cots_by_cand_for_grammar = self.poot.num_cots_by_cand(grammar)
-        self._total_cots_for_grammar = self.poot.num_total_cots(grammar)
+    def _initialize_stats_for_grammar(self, gid):
+        winner_table = self.winner_table()
+        self._cots_by_cand_for_grammar = winner_table.num_cots_by_cand(gid)
+        self._total_cots_for_grammar = winner_table.count(gid)
         self._cands_for_grammar = sorted(self._cots_by_cand_for_grammar.keys())
 
     def _get_inputs_for_grammar(self):
@@ -290,17 +473,21 @@ class Dataset(db.Document):
         return ((float(num_cots) / self._total_cots_for_grammar) * 100)
 
     def num_compatible_poots(self):
-        return len(self.raw_grammars)
+        return len(self.grammar_ids)
 
     def num_total_poots(self):
+        if not self.uses_lattice():
+            return NUM_STRICT_ORDERS[len(self.constraints)]
         return self.poot.num_total_poots()
 
     def num_compatible_cots(self):
         length_of_cot = sum(range(len(self.constraints)))
-        cots = [g for g in self.raw_grammars if len(g) == length_of_cot]
+        cots = [g for g in self.grammar_ids if popcount(g) == length_of_cot]
         return len(cots)
 
     def num_total_cots(self):
+        if not self.uses_lattice():
+            return math.factorial(len(self.constraints))
         return self.poot.num_total_cots()
 
     def save(self):
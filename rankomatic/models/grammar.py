@@ -1,15 +1,86 @@
+from bson.dbref import DBRef
+from pymongo.errors import DuplicateKeyError
+
 from rankomatic import db
+from rankomatic.lattice.encoding import grammar_id, grammar_from_id, num_pairs
 from util import pair_to_string
 from graphs import GrammarGraph
 
 
 class RawGrammar(db.Document):
-    grammar = db.StringField(unique=True)
+    """A strict order, stored as its integer id (see lattice.encoding)."""
+    grammar = db.LongField(unique=True)
     meta = {'indexes': ['grammar']}
 
 
+class RawGrammarTable(object):
+    """In-process interning table of RawGrammar documents.
+
+    Maps grammar ids to RawGrammar ObjectIds and back, filling itself with
+    one query per batch of unknown grammars, so grammar lists are built and
+    read without a round-trip per grammar.
+
+    """
+
+    def __init__(self):
+        self._oids = {}
+        self._grammar_ids = {}
+        self._loaded = set()
+
+    def load(self, n):
+        """Intern every installed grammar over at most n constraints."""
+        if n not in self._loaded:
+            # pair bits over n constraints are a prefix of those over n + 1
+            self._fetch({'grammar': {'$lt': 1 << num_pairs(n)}})
+            self._loaded.add(n)
+
+    def refs(self, gids):
+        """Return a RawGrammar reference for each grammar id.
+
+        Grammars that aren't installed yet are registered in bulk.
+
+        """
+        missing = list(set(gids) - set(self._oids))
+        if missing:
+            self._fetch({'grammar': {'$in': missing}})
+            self._create([gid for gid in missing if gid not in self._oids])
+        name = RawGrammar._get_collection_name()
+        return [DBRef(name, self._oids[gid]) for gid in gids]
+
+    def grammar_ids(self, oids):
+        """Return the grammar id of each RawGrammar ObjectId."""
+        missing = list(set(oids) - set(self._grammar_ids))
+        if missing:
+            self._fetch({'_id': {'$in': missing}})
+        return [self._grammar_ids[oid] for oid in oids]
+
+    def _fetch(self, spec):
+        for doc in RawGrammar._get_collection().find(spec):
+            self._add(doc['_id'], doc['grammar'])
+
+    def _create(self, gids):
+        if not gids:
+            return
+        docs = [{'grammar': gid} for gid in gids]
+        try:
+            RawGrammar._get_collection().insert(docs, continue_on_error=True)
+        except DuplicateKeyError:
+            # another worker registered some of them first
+            self._fetch({'grammar': {'$in': gids}})
+        else:
+            for doc in docs:
+                self._add(doc['_id'], doc['grammar'])
+
+    def _add(self, oid, gid):
+        self._oids[gid] = oid
+        self._grammar_ids[oid] = gid
+
+
+raw_grammar_table = RawGrammarTable()
+
+
 class Grammar(db.EmbeddedDocument):
-    _raw_grammar_str = db.ReferenceField(RawGrammar, required=True)
+    _raw_grammar_doc = db.ReferenceField(RawGrammar, required=True)
     _dset = db.ReferenceField('Dataset')
 
     @property
@@ -28,7 +99,7 @@ class Grammar(db.EmbeddedDocument):
             self.dset_to_return = self._dset
 
     def __init__(self, frozenset_gram=None, dataset=None,
-                 list_gram=None, *args, **kwargs):
+                 list_gram=None, gram_id=None, *args, **kwargs):
         super(Grammar, self).__init__(*args, **kwargs)
         if dataset is not None:  # None when coming from DB
             self.dset = dataset
@@ -39,12 +110,23 @@ class Grammar(db.EmbeddedDocument):
             frozenset_gram = self._make_frozenset_gram()
 
         if frozenset_gram is not None:
-            frozenset_gram = frozenset(sorted(list(frozenset_gram)))
-
-            self._raw_grammar_str = RawGrammar.objects.get(
-                grammar=str(frozenset_gram)
-            )
-            self._raw_grammar = frozenset_gram
+            self._raw_grammar = frozenset(frozenset_gram)
+            gram_id = grammar_id(self._raw_grammar)
+
+        if gram_id is not None:
+            self._raw_grammar_doc = raw_grammar_table.refs([gram_id])[0]
+            self._grammar_id = gram_id
+
+    @classmethod
+    def from_ids(cls, gram_ids, dataset):
+        """Make a Grammar for each id, resolving them all at once."""
+        refs = raw_grammar_table.refs(gram_ids)
+        grammars = []
+        for gid, ref in zip(gram_ids, refs):
+            gram = cls(dataset=dataset, _raw_grammar_doc=ref)
+            gram._grammar_id = gid
+            grammars.append(gram)
+        return grammars
 
     def _make_frozenset_gram(self):
         return frozenset([self._tuple_rel(rel) for rel in self.list_grammar])
@@ -55,12 +137,25 @@ class Grammar(db.EmbeddedDocument):
             self.dset.constraints.index(rel[0]) + 1
         )
 
+    @property
+    def grammar_id(self):
+        try:
+            return self._grammar_id
+        except AttributeError:
+            oid = self.raw_grammar_oid()
+            self._grammar_id = raw_grammar_table.grammar_ids([oid])[0]
+        return self._grammar_id
+
+    def raw_grammar_oid(self):
+        """The referenced RawGrammar's ObjectId, without dereferencing."""
+        return self._data['_raw_grammar_doc'].id
+
     @property
     def raw_grammar(self):
         try:
             return self._raw_grammar
         except AttributeError:
-            self._raw_grammar = eval(self._raw_grammar_str.grammar)
+            self._raw_grammar = grammar_from_id(self.grammar_id)
         return self._raw_grammar
 
     @property
@@ -108,12 +203,23 @@ class Grammar(db.EmbeddedDocument):
         else:
             return ' }'
 
-    def visualize(self, dset_name, index):
+    def visualize(self):
         """Create an AGraph version of the given grammar."""
-        graph = GrammarGraph(self.list_grammar, dset_name, index)
-        graph.visualize()
+        self.graph().visualize()
+
+    def graph(self):
+        return GrammarGraph(self.list_grammar)
 
 
 class GrammarList(db.Document):
     grammars = db.ListField(db.EmbeddedDocumentField(Grammar, default=None),
                             default=None)
+
+    def grammar_ids(self):
+        """Return the id of every grammar, resolved in a single lookup."""
+        unresolved = [g for g in self.grammars
+                      if not hasattr(g, '_grammar_id')]
+        oids = [g.raw_grammar_oid() for g in unresolved]
+        for gram, gid in zip(unresolved, raw_grammar_table.grammar_ids(oids)):
+            gram._grammar_id = gid
+        return [g.grammar_id for g in self.grammars]
@@ -1,23 +1,53 @@
 import pygraphviz
+import gevent
 import gridfs
+import hashlib
+import json
 import urllib
-import tempfile
+from datetime import datetime, timedelta
 
-from collections import defaultdict
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from gridfs.grid_file import DEFAULT_CHUNK_SIZE
 from rankomatic import db
 
 APRIORI_EDGE_STYLE = 'dashed'
+# shared grammar graphs not shown for this long are removed by the sweeper
+GRAMMAR_GRAPH_TTL = timedelta(days=30)
+# a stored graph's last access is only rewritten when it is this stale
+LAST_ACCESS_RESOLUTION = timedelta(minutes=10)
+
+# what a stored graph can be served as, and the mimetype for each
+RENDER_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+    'dot': 'text/vnd.graphviz'
+}
+# rendered along with the DOT, by the worker storing the graph, so pages
+# never wait on a layout
+PRERENDERED_FORMATS = ['svg']
 
 
 class GridFSGraph(pygraphviz.AGraph):
+    """A graph whose DOT description is stored in GridFS.
 
-    FILETYPE = 'png'
+    The description is stored along with a render in each of
+    PRERENDERED_FORMATS; other formats are rendered from it when first
+    requested (see RenderedGraph). Graphs made for a dataset are tagged
+    with its id, so they can be removed together, and every graph records
+    when it was last accessed, so it can expire.
+
+    """
+
+    FILETYPE = 'dot'
     FS_COLL = 'tmp'
 
-    def __init__(self, dset_name=None, basename=None, *args, **kwargs):
+    def __init__(self, dset_name=None, basename=None, dset_id=None,
+                 *args, **kwargs):
         super(GridFSGraph, self).__init__(encoding='UTF-8', *args, **kwargs)
         self._check_args(dset_name=dset_name, basename=basename)
         self.dset_name = dset_name
+        self.dset_id = dset_id
         self.basename = basename
         self.filename = self._make_filename()
         self.fs = gridfs.GridFS(db.get_pymongo_db(), collection=self.FS_COLL)
@@ -37,10 +67,38 @@ class GridFSGraph(pygraphviz.AGraph):
             self.store_graph()
 
     def store_graph(self):
-        with tempfile.TemporaryFile() as tf:
-            self.draw(tf, format=GridFSGraph.FILETYPE)
-            tf.seek(0)  # reset file object to beginnning
-            self.fs.put(tf, filename=self.filename)
+        file_docs, chunks = self.gridfs_documents()
+        _insert_files(db.get_pymongo_db()[self.FS_COLL], file_docs, chunks)
+
+    def _file_metadata(self):
+        metadata = {'last_access': datetime.utcnow()}
+        if self.dset_id is not None:
+            metadata['dataset'] = self.dset_id
+        return {'metadata': metadata}
+
+    def gridfs_documents(self):
+        """The GridFS file documents and chunks storing this graph.
+
+        The first file is the DOT, and the rest its prerendered formats.
+
+        """
+        dot = self.string()
+        if isinstance(dot, unicode):
+            dot = dot.encode('utf-8')
+        dot_doc, chunks = _gridfs_file(self.filename, dot,
+                                       GridFSGraph.FILETYPE, encoding='utf-8',
+                                       **self._file_metadata())
+        file_docs = [dot_doc]
+        path = self.filename[:-len(GridFSGraph.FILETYPE) - 1]
+        metadata = _render_metadata(dot_doc['metadata'], dot_doc['_id'])
+        for fmt in PRERENDERED_FORMATS:
+            filename = render_filename(path, dot_doc['md5'], fmt)
+            file_doc, render_chunks = _gridfs_file(
+                filename, render(dot, fmt), fmt, metadata=metadata
+            )
+            file_docs.append(file_doc)
+            chunks.extend(render_chunks)
+        return file_docs, chunks
 
     def is_visualized(self):
         try:
@@ -60,12 +118,195 @@ class GridFSGraph(pygraphviz.AGraph):
         raise NotImplementedError("Define this in subclass")
 
 
+def _gridfs_file(filename, data, fmt, **fields):
+    """A GridFS file document for data, and the chunks holding it."""
+    file_id = ObjectId()
+    file_doc = {
+        '_id': file_id,
+        'filename': filename,
+        'contentType': RENDER_FORMATS[fmt],
+        'chunkSize': DEFAULT_CHUNK_SIZE,
+        'length': len(data),
+        'md5': hashlib.md5(data).hexdigest(),
+        'uploadDate': datetime.utcnow()
+    }
+    file_doc.update(fields)
+    chunks = [
+        {'files_id': file_id, 'n': n,
+         'data': Binary(data[start:start + DEFAULT_CHUNK_SIZE])}
+        for n, start in enumerate(xrange(0, len(data), DEFAULT_CHUNK_SIZE))
+    ]
+    return file_doc, chunks
+
+
+def _insert_files(fs, file_docs, chunks):
+    if chunks:  # chunks first, so no file is ever missing its data
+        fs.chunks.insert(chunks)
+    if file_docs:
+        fs.files.insert(file_docs)
+
+
+def visualize_all(graphs, progress=None):
+    """Visualize several graphs, writing them to GridFS in one batch.
+
+    One query finds the graphs that are already stored, and the rest are
+    written, with their prerendered formats, in one insert into each of
+    the GridFS collections instead of a round trip per graph. The ones
+    already stored are marked accessed.
+    If given, progress is called with the number of graphs done and the
+    total after each one made.
+
+    The graphs must all be of one kind, i.e. share a GridFS collection.
+
+    """
+    if not graphs:
+        return
+    fs = db.get_pymongo_db()[graphs[0].FS_COLL]
+    files = fs.files
+    filenames = [graph.filename for graph in graphs]
+    stored = set(f['filename'] for f in
+                 files.find({'filename': {'$in': filenames}},
+                            fields=['filename']))
+    if stored:
+        _touch(files, {'filename': {'$in': list(stored)}})
+    file_docs = []
+    chunk_docs = []
+    for i, graph in enumerate(graphs):
+        if graph.filename not in stored:
+            stored.add(graph.filename)
+            graph.make_graph()
+            graph_files, graph_chunks = graph.gridfs_documents()
+            file_docs.extend(graph_files)
+            chunk_docs.extend(graph_chunks)
+            if progress is not None:
+                progress(i + 1, len(graphs))
+    _insert_files(fs, file_docs, chunk_docs)
+
+
+def _touch(files, spec):
+    now = datetime.utcnow()
+    spec = dict(spec, **{'metadata.last_access': {
+        '$not': {'$gte': now - LAST_ACCESS_RESOLUTION}
+    }})
+    files.update(spec, {'$set': {'metadata.last_access': now}}, multi=True)
+
+
+def remove_graph_files(spec, fs_coll=GridFSGraph.FS_COLL):
+    """Remove the files matching spec, with all of their chunks.
+
+    The files are removed with one delete from each GridFS collection, and
+    so are the renders made from them. Returns the number of files removed.
+
+    """
+    fs_db = db.get_pymongo_db()
+    files = fs_db[fs_coll].files
+    files.ensure_index('metadata.source')
+    file_ids = [f['_id'] for f in files.find(spec, fields=['_id'])]
+    if file_ids:
+        file_ids.extend(f['_id'] for f in files.find(
+            {'metadata.source': {'$in': file_ids}}, fields=['_id']
+        ))
+        files.remove({'_id': {'$in': file_ids}})
+        fs_db[fs_coll].chunks.remove({'files_id': {'$in': file_ids}})
+    return len(file_ids)
+
+
+def remove_dataset_graphs(dset_ids, fs_coll=GridFSGraph.FS_COLL):
+    """Remove every file stored for the datasets with these ids.
+
+    Files are found through an index on their dataset id.
+
+    """
+    files = db.get_pymongo_db()[fs_coll].files
+    files.ensure_index('metadata.dataset')
+    return remove_graph_files({'metadata.dataset': {'$in': list(dset_ids)}},
+                              fs_coll)
+
+
+def remove_expired_grammar_graphs(now=None):
+    """Remove the grammar graphs not accessed within GRAMMAR_GRAPH_TTL."""
+    cutoff = (now or datetime.utcnow()) - GRAMMAR_GRAPH_TTL
+    files = db.get_pymongo_db()[GrammarGraph.FS_COLL].files
+    files.ensure_index('metadata.last_access')
+    return remove_graph_files({'metadata.last_access': {'$lt': cutoff}},
+                              GrammarGraph.FS_COLL)
+
+
+class RenderedGraph(object):
+    """A stored graph, rendered in one of RENDER_FORMATS.
+
+    Renders are cached in GridFS alongside the DOT they came from and are
+    named by its md5, so storing a new version of a graph invalidates
+    them. The md5 and format also make a strong ETag. A format that wasn't
+    prerendered is rendered in gevent's threadpool, so the web worker
+    keeps serving other requests meanwhile.
+
+    Raises gridfs.NoFile if the graph hasn't been stored.
+
+    """
+
+    def __init__(self, path, fmt, fs_coll=GridFSGraph.FS_COLL):
+        self.fs = gridfs.GridFS(db.get_pymongo_db(), collection=fs_coll)
+        self.path = path
+        self.fmt = fmt
+        self.mimetype = RENDER_FORMATS[fmt]
+        self.source = self.fs.get_last_version(
+            filename=self._filename(GridFSGraph.FILETYPE)
+        )
+        self.etag = '%s.%s' % (self.source.md5, fmt)
+
+    def read(self):
+        if self.fmt == GridFSGraph.FILETYPE:
+            return self.source.read()
+        filename = render_filename(self.path, self.source.md5, self.fmt)
+        try:
+            return self.fs.get_last_version(filename=filename).read()
+        except gridfs.NoFile:
+            data = gevent.get_hub().threadpool.apply(
+                render, (self.source.read(), self.fmt)
+            )
+            metadata = _render_metadata(self.source.metadata, self.source._id)
+            self.fs.put(data, filename=filename, contentType=self.mimetype,
+                        metadata=metadata)
+            return data
+
+    def _filename(self, *extensions):
+        return '.'.join((self.path,) + extensions)
+
+
+def render_filename(path, md5, fmt):
+    return '.'.join([path, md5, fmt])
+
+
+def _render_metadata(source_metadata, source_id):
+    # renders go with the DOT, and expire along with it
+    metadata = dict(source_metadata or {}, source=source_id)
+    metadata.pop('last_access', None)
+    return metadata
+
+
+def render(dot, fmt):
+    """Lay out a DOT description and draw it in the given format."""
+    graph = pygraphviz.AGraph(string=dot)
+    graph.layout('dot')
+    return graph.draw(format=fmt)
+
+
 class EntailmentGraph(GridFSGraph):
+    """The entailments between a dataset's candidates, drawn as a DAG.
+
+    Equivalent candidates (strongly connected components) are collapsed
+    into a single node, and only the transitive reduction of the rest is
+    handed to graphviz, so nothing quadratic happens in the graph library.
+    A priori entailments are reduced the same way and drawn dashed.
+
+    """
 
     def __init__(self, global_entailments, apriori_entailments,
-                 dset_name, num_cots_by_cand):
+                 dset_name, num_cots_by_cand, dset_id=None):
         super(EntailmentGraph, self).__init__(dset_name=dset_name,
                                               basename='entailments',
+                                              dset_id=dset_id,
                                               directed=True)
         self.entailments = global_entailments
         self.apriori_entailments = apriori_entailments
@@ -73,79 +314,48 @@ class EntailmentGraph(GridFSGraph):
 
     def make_graph(self):
         self._add_edges()
-        self._collapse_cycles()
         self.node_attr['shape'] = 'rect'
-        self.tred()
         self._add_apriori_edges()
-        self.layout('dot')
 
     def _add_edges(self):
-        for k, v in self.entailments.iteritems():
-            for entailed in v:
-                self.add_edge(k, entailed)
+        components, edges = reduce_graph(self.entailments)
+        self.node_names = {}
+        names = [self._add_node(component) for component in components]
+        for tail, head in edges:
+            self.add_edge(names[tail], names[head])
+
+    def _add_node(self, component):
+        if len(component) == 1:
+            name = component[0]
+            self.add_node(name)
+        else:
+            name = self._make_node_label(component)
+            self.add_node(name, label=name)
+        for cand in component:
+            self.node_names[cand] = name
+        return name
 
     def _add_apriori_edges(self):
-        self._make_apriori_graph()
-        self.apriori_graph.tred()
-        self._add_remaining_apriori_edges()
-
-    def _make_apriori_graph(self):
-        self.apriori_graph = pygraphviz.AGraph(encoding="UTF-8", directed=True)
-        for k, v in self.apriori_entailments.iteritems():
-            for entailed in v:
-                self.apriori_graph.add_edge(k, entailed)
-
-    def _add_remaining_apriori_edges(self):
-        for edge in self.apriori_graph.edges():
-            edge = map(self._get_partial_match_node, edge)
-            self.add_edge(edge, style=APRIORI_EDGE_STYLE)
-
-    def _get_partial_match_node(self, partial):
-        matches = [n for n in self.nodes() if partial in n]
-        if matches:
-            return matches[0]
-        else:
-            msg = "Node matching {} not in graph".format(partial)
+        components, edges = reduce_graph(self.apriori_entailments)
+        for component in components:  # keep equivalences as a cycle
+            if len(component) > 1:
+                heads = component[1:] + component[:1]
+                for tail, head in zip(component, heads):
+                    self._add_apriori_edge(tail, head)
+        for tail, head in edges:
+            self._add_apriori_edge(components[tail][0], components[head][0])
+
+    def _add_apriori_edge(self, tail, head):
+        edge = map(self._get_node_name, (tail, head))
+        self.add_edge(edge, style=APRIORI_EDGE_STYLE)
+
+    def _get_node_name(self, cand):
+        try:
+            return self.node_names[cand]
+        except KeyError:
+            msg = "Node matching {} not in graph".format(cand)
             raise KeyError(msg)
 
-    def _collapse_cycles(self):
-        self._get_equivalent_nodes()
-        self._get_cycles_from_equivalent_nodes()
-        self._remove_cycles_from_graph()
-
-    def _get_equivalent_nodes(self):
-        self.equivalent_nodes = defaultdict(lambda: set([]))
-        self._edges = set(self.edges())  # for determining membership later
-        for e in self._edges:
-            if self._nodes_equiv(e):
-                self._add_equiv_nodes(e)
-
-    def _nodes_equiv(self, edge):
-        reverse_edge = (edge[1], edge[0])
-        return reverse_edge in self._edges
-
-    def _add_equiv_nodes(self, edge):
-        self.equivalent_nodes[edge[0]].add(edge[1])
-        self.equivalent_nodes[edge[1]].add(edge[0])
-
-    def _get_cycles_from_equivalent_nodes(self):
-        cycles = [frozenset(v) for k, v in self.equivalent_nodes.iteritems()]
-        self.cycles = set(cycles)
-
-    def _remove_cycles_from_graph(self):
-        for cycle in self.cycles:  # collapse the cycles
-            self._collapse_single_cycle(cycle)
-
-        for cycle in self.cycles:  # re-iterate in case cycles are connected
-            self.delete_nodes_from(cycle)
-
-    def _collapse_single_cycle(self, cycle):
-        # make the label for the collapsed node and put it in the graph
-        cycle = list(cycle)
-        node_label = self._make_node_label(cycle)
-        self._add_edges_to_and_from_collapsed_cycle(cycle, node_label)
-        self.get_node(node_label).attr['label'] = node_label
-
     def _make_node_label(self, cycle):
         chunks = list(self._chunks(cycle))
         label = ''.join([self._pretty_chunk_string(chunk) for chunk in chunks])[:-5]
@@ -159,24 +369,158 @@ class EntailmentGraph(GridFSGraph):
     def _pretty_chunk_string(self, chunk):
         return "(" + "), (".join(chunk) + ")<BR/>"  # html-like label
 
-    def _add_edges_to_and_from_collapsed_cycle(self, cycle, node_label):
-        for edge in self.edges():
-            if edge[0] in cycle:
-                self.add_edge(node_label, edge[1])
-            if edge[1] in cycle:
-                self.add_edge(edge[0], node_label)
+
+def reduce_graph(successors):
+    """Condense a digraph and take the transitive reduction of the result.
+
+    successors maps each node to a list of the nodes it points to. Returns
+    the strongly connected components as sorted lists of nodes, themselves
+    sorted, and the edges of the reduced DAG between them as pairs of
+    indices into that list.
+
+    """
+    components = sorted(sorted(c) for c in
+                        strongly_connected_components(successors))
+    component_of = {}
+    for i, component in enumerate(components):
+        for node in component:
+            component_of[node] = i
+    dag = [0] * len(components)
+    for node, heads in successors.iteritems():
+        for head in heads:
+            dag[component_of[node]] |= 1 << component_of[head]
+    for i in xrange(len(components)):
+        dag[i] &= ~(1 << i)
+    reduced = transitive_reduction(dag)
+    edges = [(i, j) for i, heads in enumerate(reduced)
+             for j in xrange(len(components)) if heads >> j & 1]
+    return components, edges
+
+
+def strongly_connected_components(successors):
+    """Tarjan's algorithm, iteratively, over a dict of successor lists.
+
+    Components are yielded in reverse topological order: every component
+    comes after all those reachable from it.
+
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    nodes = set(successors)
+    for heads in successors.itervalues():
+        nodes.update(heads)
+    for root in sorted(nodes):
+        if root in index:
+            continue
+        work = [(root, iter(successors.get(root, ())))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, heads = work[-1]
+            for head in heads:
+                if head not in index:
+                    index[head] = lowlink[head] = len(index)
+                    stack.append(head)
+                    on_stack.add(head)
+                    work.append((head, iter(successors.get(head, ()))))
+                    break
+                elif head in on_stack:
+                    lowlink[node] = min(lowlink[node], index[head])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    yield component
+
+
+def transitive_reduction(dag):
+    """Reduce a DAG given as a list of successor bitsets.
+
+    An edge i -> j is redundant when j can be reached from another
+    successor of i. Reachability is one bitset per node, filled in from
+    the sinks up.
+
+    """
+    reach = [None] * len(dag)
+    for i in _topological_order(dag)[::-1]:
+        reach[i] = dag[i]
+        for j in _bits(dag[i]):
+            reach[i] |= reach[j]
+    reduced = []
+    for i, heads in enumerate(dag):
+        redundant = 0
+        for j in _bits(heads):
+            redundant |= reach[j]
+        reduced.append(heads & ~redundant)
+    return reduced
+
+
+def _topological_order(dag):
+    in_degree = [0] * len(dag)
+    for heads in dag:
+        for j in _bits(heads):
+            in_degree[j] += 1
+    order = [i for i, degree in enumerate(in_degree) if not degree]
+    for i in order:  # order grows as nodes become sources
+        for j in _bits(dag[i]):
+            in_degree[j] -= 1
+            if not in_degree[j]:
+                order.append(j)
+    return order
+
+
+def _bits(subset):
+    i = 0
+    while subset:
+        if subset & 1:
+            yield i
+        subset >>= 1
+        i += 1
 
 
 class GrammarGraph(GridFSGraph):
+    """A grammar's graph, shared by every dataset with that grammar.
+
+    Graphs are stored in their own collection under a hash of the
+    grammar's relations, which name the constraints, so re-sorting or
+    copying a dataset finds its grammar graphs already stored.
+
+    """
 
-    def __init__(self, grammar, dset_name, index):
-        super(GrammarGraph, self).__init__(dset_name=dset_name,
-                                           basename=("grammar%d" % index),
+    FS_COLL = 'grammar_graphs'
+    DIRECTORY = 'grammars'
+
+    def __init__(self, grammar):
+        super(GrammarGraph, self).__init__(dset_name=self.DIRECTORY,
+                                           basename=grammar_graph_key(grammar),
                                            directed=True, rankdir="LR")
         self.grammar = grammar
 
     def make_graph(self):
+        successors = {}
+        for rel in self.grammar:
+            successors.setdefault(rel[0], []).append(rel[1])
+        components, edges = reduce_graph(successors)
+        reduced = set((components[tail][0], components[head][0])
+                      for tail, head in edges)
         for rel in self.grammar:
-            self.add_edge(rel[0], rel[1])
-        self.tred()
-        self.layout('dot')
+            if tuple(rel) in reduced:
+                self.add_edge(rel[0], rel[1])
+
+
+def grammar_graph_key(grammar):
+    """The name a list grammar's graph is stored under."""
+    relations = sorted(list(rel) for rel in grammar)
+    return hashlib.sha1(json.dumps(relations)).hexdigest()
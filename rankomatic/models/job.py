@@ -0,0 +1,116 @@
+import calendar
+import datetime
+import time
+
+from rankomatic import db
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+JOB_STATES = [QUEUED, RUNNING, DONE, FAILED]
+FINISHED_STATES = frozenset([DONE, FAILED])
+
+# Mongo removes a job this long after its last change of state
+JOB_TTL_SECONDS = 24 * 60 * 60
+# how long a request waits for a job to change, and how often it looks.
+# Both are held by a gevent worker, well within gunicorn's 30s timeout.
+JOB_WAIT_TIMEOUT = 15
+JOB_WAIT_INTERVAL = 0.5
+# how long a stream of a dataset's jobs lasts before the client reconnects
+JOB_STREAM_TIMEOUT = 15
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Job(db.Document):
+    """A calculation requested of otorderd, and how far it has got.
+
+    The web process creates a job when it enqueues one, and the daemon
+    publishes each change of state to every job merged into the same
+    calculation, along with the progress its worker reports while it runs.
+    The results themselves are saved on the dataset, which the pages
+    render them from once the job is done.
+
+    """
+    func = db.StringField(required=True)
+    dataset = db.ObjectIdField()
+    state = db.StringField(default=QUEUED, choices=JOB_STATES)
+    progress = db.DictField()
+    updated = db.DateTimeField(default=datetime.datetime.utcnow)
+    meta = {'indexes': [
+        {'fields': ['updated'], 'expireAfterSeconds': JOB_TTL_SECONDS},
+        ('dataset', 'updated')
+    ]}
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'func': self.func,
+            'state': self.state,
+            'progress': self.progress
+        }
+
+    @classmethod
+    def publish(cls, job_ids, state):
+        """Move the jobs with these ids to a new state, in one update."""
+        cls.objects(id__in=job_ids).update(
+            set__state=state, set__updated=datetime.datetime.utcnow()
+        )
+
+    @classmethod
+    def publish_progress(cls, job_ids, progress):
+        cls.objects(id__in=job_ids).update(
+            set__progress=progress, set__updated=datetime.datetime.utcnow()
+        )
+
+    @classmethod
+    def wait(cls, job_id, seen_state):
+        """Return the job once its state isn't seen_state, or at timeout.
+
+        Only the state is read until it changes.
+
+        """
+        deadline = time.time() + JOB_WAIT_TIMEOUT
+        while (cls.objects(id=job_id).scalar('state').first() == seen_state
+               and time.time() < deadline):
+            time.sleep(JOB_WAIT_INTERVAL)
+        return cls.objects.get(id=job_id)
+
+    @classmethod
+    def changes(cls, dataset_id, since):
+        """Generate the dataset's jobs changed from since on, for a while.
+
+        An index on the dataset and update time finds the jobs that changed
+        since the last look, so a client that reconnects from the time of
+        the last job it saw misses nothing.
+
+        """
+        seen = {}
+        deadline = time.time() + JOB_STREAM_TIMEOUT
+        while True:
+            changed = cls.objects(dataset=dataset_id, updated__gte=since)
+            for job in changed.order_by('updated'):
+                if seen.get(job.id) != job.updated:
+                    seen[job.id] = since = job.updated
+                    yield job
+            if time.time() >= deadline:
+                return
+            time.sleep(JOB_WAIT_INTERVAL)
+
+
+def to_millis(when):
+    """Convert a UTC datetime to milliseconds since the epoch.
+
+    Mongo keeps times to the millisecond, so this is exact for stored times.
+
+    """
+    return (calendar.timegm(when.utctimetuple()) * 1000 +
+            when.microsecond // 1000)
+
+
+def from_millis(millis):
+    return EPOCH + datetime.timedelta(milliseconds=millis)
@@ -0,0 +1,79 @@
+import datetime
+
+from rankomatic import db
+
+# grammar lists longer than this would risk Mongo's document size limit
+MAX_CACHED_GRAMMARS = 100000
+# Mongo removes a result this long after it was last used
+CACHED_RESULT_TTL_SECONDS = 30 * 24 * 60 * 60
+# a result's last use is only rewritten when it is this stale
+LAST_USED_RESOLUTION = datetime.timedelta(hours=1)
+
+# results that are the same whatever the a priori ranking
+APRIORI_INDEPENDENT_KINDS = frozenset(['global_entailments'])
+
+
+class CachedResult(db.Document):
+    """A computed result shared by every dataset with the same content.
+
+    Results are keyed by Dataset.content_hash plus the kind of result and
+    whatever request parameters it depends on, so copies of a tableau
+    (signup copies, edit copies, examples) are only ever computed once.
+    Kinds in APRIORI_INDEPENDENT_KINDS leave the a priori ranking out of
+    the hash, so they survive changes to it.
+
+    A TTL index removes results that haven't been used for a while, since
+    every edit, sort and page of a tableau stores new ones. Deleting a
+    dataset leaves its results to the TTL, as other copies may share them.
+
+    """
+    key = db.StringField(required=True, unique=True)
+    value = db.DynamicField()
+    last_used = db.DateTimeField()
+    meta = {'indexes': [
+        'key',
+        {'fields': ['last_used'],
+         'expireAfterSeconds': CACHED_RESULT_TTL_SECONDS}
+    ]}
+
+    @classmethod
+    def make_key(cls, content_hash, kind, *params):
+        return ':'.join([content_hash, kind] + [str(p) for p in params])
+
+    @classmethod
+    def dataset_key(cls, dset, kind, *params):
+        content_hash = dset.content_hash(
+            apriori=kind not in APRIORI_INDEPENDENT_KINDS
+        )
+        return cls.make_key(content_hash, kind, *params)
+
+    @classmethod
+    def lookup(cls, dset, kind, *params):
+        """Return the stored value, or None if it hasn't been computed."""
+        key = cls.dataset_key(dset, kind, *params)
+        result = cls.objects(key=key).first()
+        if result is None:
+            return None
+        result._mark_used()
+        return result.value
+
+    def _mark_used(self):
+        now = datetime.datetime.utcnow()
+        if (self.last_used is None or
+                now - self.last_used >= LAST_USED_RESOLUTION):
+            CachedResult.objects(id=self.id).update_one(set__last_used=now)
+
+    @classmethod
+    def store(cls, dset, kind, value, *params):
+        key = cls.dataset_key(dset, kind, *params)
+        cls.objects(key=key).update_one(
+            set__value=value, set__last_used=datetime.datetime.utcnow(),
+            upsert=True
+        )
+
+    @classmethod
+    def backfill_last_used(cls, now=None):
+        """Start the TTL of results stored before their use was recorded."""
+        return cls.objects(last_used__exists=False).update(
+            set__last_used=now or datetime.datetime.utcnow()
+        )
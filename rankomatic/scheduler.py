@@ -0,0 +1,100 @@
+"""Decide which of otorderd's queued jobs each idle worker runs next.
+
+Jobs go in one of two lanes. The interactive lane holds the jobs a page
+is waiting on that are cheap to run, and is always served first. The
+batch lane holds the rest, and some workers are kept back from it so the
+interactive lane never waits behind a long calculation. Within a lane,
+each user's jobs are queued separately and the users take turns, so one
+user's batch of datasets can't starve everyone else.
+
+"""
+from collections import deque
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+LANES = [INTERACTIVE, BATCH]
+
+# jobs for a page of results, which are cheap whatever the dataset
+INTERACTIVE_FUNCS = frozenset(['make_grammar_info'])
+# other jobs estimated to cost at most this are interactive too
+MAX_INTERACTIVE_COST = 10000
+DEFAULT_RESERVED_WORKERS = 1
+
+
+def job_lane(msg):
+    if (msg['func'] in INTERACTIVE_FUNCS or
+            msg.get('cost', 0) <= MAX_INTERACTIVE_COST):
+        return INTERACTIVE
+    return BATCH
+
+
+class FairQueue(object):
+    """Jobs queued per user, taken from each user in turn."""
+
+    def __init__(self):
+        self.queues = {}
+        self.turns = deque()
+
+    def __len__(self):
+        return len(self.turns)
+
+    def push(self, user, job):
+        if user not in self.queues:
+            self.queues[user] = deque()
+            self.turns.append(user)
+        self.queues[user].append(job)
+
+    def pop(self):
+        user = self.turns.popleft()
+        queue = self.queues[user]
+        job = queue.popleft()
+        if queue:
+            self.turns.append(user)
+        else:
+            del self.queues[user]
+        return job
+
+
+class Scheduler(object):
+    """Assign queued jobs to workers, which are numbered from 0.
+
+    At most num_workers - reserved workers run batch jobs at once, but at
+    least one does, or batch jobs would never run. So with no more workers
+    than are reserved, nothing is kept back, and an interactive job can
+    wait behind a long batch job.
+
+    """
+
+    def __init__(self, num_workers, reserved=DEFAULT_RESERVED_WORKERS):
+        self.idle = deque(xrange(num_workers))
+        self.max_batch = max(num_workers - reserved, 1)
+        self.running = {}  # lane of each busy worker's job
+        self.lanes = dict((lane, FairQueue()) for lane in LANES)
+
+    def add(self, msg):
+        self.lanes[job_lane(msg)].push(msg.get('user'), msg)
+
+    def assign(self):
+        """Generate (worker, msg) for each job that can start now."""
+        while self.idle:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            worker = self.idle.popleft()
+            self.running[worker] = lane
+            yield worker, self.lanes[lane].pop()
+
+    def _next_lane(self):
+        if self.lanes[INTERACTIVE]:
+            return INTERACTIVE
+        if self.lanes[BATCH] and self._num_running(BATCH) < self.max_batch:
+            return BATCH
+        return None
+
+    def _num_running(self, lane):
+        return sum(1 for running in self.running.values() if running == lane)
+
+    def release(self, worker):
+        """Mark a worker idle once its job is done."""
+        if self.running.pop(worker, None) is not None:
+            self.idle.append(worker)
@@ -4,6 +4,7 @@
     var spinner = new Spinner(Util.spinner_opts).spin(target);
     var dset_name = $("#info").attr("dset_name");
     var sort_value = $("#info").attr("sort_value");
+    var job_id = $("#info").attr("job_id");
     var stats_calculated_url = '/global_stats_calculated/' + dset_name + '/' +
               sort_value +
               '?page=' + QueryString.page +
@@ -16,8 +17,23 @@
               '&classical=' + QueryString.classical +
               '&sort_by=' + QueryString.sort_by;
     var no_grammars = Handlebars.compile($("#no_grammars_template").html());
+    var job_failed = Handlebars.compile($("#job_failed_template").html());
 
-    (function get_stats_if_calculated() {
+    Util.follow_job(dset_name, job_id, $('#progress'), function(job) {
+        if (job.state === 'failed') {
+            show_failure();
+        } else {
+            get_stats_if_calculated();
+        }
+    });
+
+    function show_failure() {
+        spinner.stop();
+        $('#global-statistics').html(job_failed({dset_name: dset_name}));
+        $('#grammars').hide();
+    }
+
+    function get_stats_if_calculated() {
         $.ajax({
             url: stats_calculated_url,
             dataType: "json",
@@ -30,10 +46,15 @@
                     if (data['grammars_exist']) {
                         $('#grammars').show();
                         $('#global-statistics').html(data['html_str']);
-                        setTimeout( function() {
-                            poll_for_grammar_stats(data['grammar_stat_url'],
-                                                   spinner);
-                        }, RETRY_WAIT_TIME);
+                        Util.follow_job(dset_name, data['grammar_stat_job'],
+                                        $('#progress'), function(job) {
+                            if (job.state === 'failed') {
+                                show_failure();
+                            } else {
+                                poll_for_grammar_stats(
+                                    data['grammar_stat_url'], spinner);
+                            }
+                        });
                     } else {
                         spinner.stop();
                         $('#global-statistics').html(no_grammars(data));
@@ -42,7 +63,7 @@
                 }
             }
         })
-    })();
+    }
 
     function poll_for_grammar_stats(url, spinner) {
         $.ajax({
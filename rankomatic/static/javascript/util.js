@@ -30,6 +30,89 @@ var Util = {
         var meta_chars = /([ !"#$%&'()*+,.\/:;<=>?@[\\\]^`{|}~`'"])/g
         var escaped_char = '\\$&'
         return str.replace(meta_chars, escaped_char);
+    },
+
+    /* function: wait_for_job
+     * usage: Util.wait_for_job(job_id, function(job) { ... });
+     * ========================================================
+     * Long poll /jobs/<job_id> until the job is done or has failed, then
+     * call on_finish with it.
+     *
+     * Each request is held by the server until the job's state changes
+     * from the one last seen, so there is no polling interval to tune.
+     */
+    wait_for_job: function(job_id, on_finish, state) {
+        $.ajax({
+            url: '/jobs/' + job_id,
+            data: state ? {state: state} : {},
+            dataType: 'json',
+            cache: false,
+            success: function(job) {
+                if (job.state === 'done' || job.state === 'failed') {
+                    on_finish(job);
+                } else {
+                    Util.wait_for_job(job_id, on_finish, job.state);
+                }
+            },
+            error: function() {
+                setTimeout(function() {
+                    Util.wait_for_job(job_id, on_finish, state);
+                }, 1000);
+            }
+        });
+    },
+
+    /* function: follow_job
+     * usage: Util.follow_job(dset_name, job_id, $('#progress'), on_finish);
+     * =====================================================================
+     * Show how far the job has got in $element as the dataset's stream of
+     * server-sent events reports it, then call on_finish once it is done
+     * or has failed. The stream is the page's only connection while it
+     * waits.
+     *
+     * The stream starts from when the job was created, which its id
+     * records to the second, so a job that finishes before the stream
+     * connects isn't missed. Browsers without EventSource long poll the
+     * job instead, without the progress.
+     */
+    follow_job: function(dset_name, job_id, $element, on_finish) {
+        if (typeof EventSource === 'undefined') {
+            Util.wait_for_job(job_id, on_finish);
+            return;
+        }
+        var since = parseInt(job_id.substring(0, 8), 16) * 1000;
+        var source = new EventSource('/' + dset_name + '/progress?since=' +
+                                     since);
+        source.onmessage = function(event) {
+            var job = JSON.parse(event.data);
+            if (job.id !== job_id) {
+                return;
+            }
+            if (job.state === 'done' || job.state === 'failed') {
+                source.close();
+                $element.empty();
+                on_finish(job);
+            } else if (job.state === 'running' && job.progress.stage) {
+                $element.text(Util.describe_progress(job.progress));
+            }
+        };
+    },
+
+    describe_progress: function(progress) {
+        switch (progress.stage) {
+        case 'grammars':
+            return 'Searched ' + Math.floor(progress.scanned * 100) +
+                '% of the rankings, found ' + progress.found +
+                ' compatible grammars so far';
+        case 'global_entailments':
+        case 'apriori_entailments':
+            return 'Found the entailments of ' + progress.done + ' of ' +
+                progress.total + ' candidates';
+        case 'graphs':
+            return 'Drew ' + progress.done + ' of ' + progress.total +
+                ' grammar graphs';
+        }
+        return '';
     }
 }
 
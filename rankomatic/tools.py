@@ -209,7 +209,6 @@ class EditView(CalculatorView):
         old_dset = get_dset(self.dset_name)
         self.dset.user = old_dset.user
         old_dset.delete()
-        self.dset.remove_old_files()
 
     def _save_new_version(self):
         self.dset.classical = not self.is_submitting_to_all_grammars()
@@ -275,7 +274,6 @@ class ExampleEditView(CalculatorView):
 
     def _create_dset_for_editing(self):
         self.dset = Dataset(data=self.form.data, data_is_from_form=True)
-        self.dset.remove_old_files()
         self.dset.user = get_username()
         self.dset.name = self._create_temporary_dset_name()
         self.dset.id = None  # to get a new id when saved
@@ -326,7 +324,6 @@ class SaveDsetView(MethodView):
 
         try:
             old_dset = get_dset(dset.name)
-            old_dset.remove_old_files()
             old_dset.delete()
         except HTTPException:
             pass
@@ -23,9 +23,11 @@ def get_dset(name_to_find, username=None):
     if username is None:
         username = get_username()
     try:
-        return Dataset.objects.get(name=name_to_find, user=username)
+        dset = Dataset.objects.get(name=name_to_find, user=username)
     except Dataset.DoesNotExist:
-        return Dataset.objects.get_or_404(name=name_to_find, user="guest")
+        dset = Dataset.objects.get_or_404(name=name_to_find, user="guest")
+    dset.touch()
+    return dset
 
 def get_url_args():
     classical = json.loads(request.args.get('classical').lower())
@@ -1,37 +1,86 @@
 from rankomatic import get_queue
+from rankomatic.lattice.space import NUM_STRICT_ORDERS
+from rankomatic.models.graphs import grammar_graph_key
+from rankomatic.models.job import Job
+from rankomatic.models.results import CachedResult
 from rankomatic.util import get_username, get_url_args, get_dset
+import hashlib
 import json
 
 GRAMS_PER_PAGE = 20
 
 
-def calculate_grammars_and_statistics(dset_name, sort_value):
-    queue = get_queue()
+def calculate_grammars_and_statistics(dset_name, sort_value, dset):
     classical, page, sort_by = get_url_args()
-    queue.put(json.dumps({
-        'request': 'calculate',
-        'func': 'calculate_grammars_and_statistics',
-        'args': (dset_name, sort_value, classical,
-                 page, get_username(), sort_by)
-    }))
+    return _enqueue('calculate_grammars_and_statistics',
+                    (dset_name, sort_value, classical, page, get_username(),
+                     sort_by),
+                    dset, job_version(dset))
 
 
-def calculate_entailments(dset_name):
-    queue = get_queue()
-    queue.put(json.dumps({
-        'request': 'calculate',
-        'func': 'calculate_entailments',
-        'args': (dset_name, get_username())
-    }))
+def calculate_entailments(dset_name, dset):
+    return _enqueue('calculate_entailments', (dset_name, get_username()),
+                    dset, job_version(dset))
+
+
+def make_grammar_info(dset_name, dset):
+    return _enqueue('make_grammar_info', (dset_name, get_username()),
+                    dset, job_version(dset, dset.sort_by,
+                                      dset.global_stats['grams']))
 
 
-def make_grammar_info(dset_name):
+def _enqueue(func, args, dset, version):
+    """Queue a job for the daemon, and return the id to follow it by."""
+    job = Job(func=func, dataset=dset.id)
+    job.save()
     queue = get_queue()
     queue.put(json.dumps({
         'request': 'calculate',
-        'func': 'make_grammar_info',
-        'args': (dset_name, get_username())
+        'func': func,
+        'args': args,
+        'version': version,
+        'job_id': str(job.id),
+        'user': get_username(),
+        'cost': job_cost(func, dset),
+        'num_constraints': len(dset.constraints)
     }))
+    return str(job.id)
+
+
+def job_cost(func, dset):
+    """Estimate a job's work, in candidates checked against orders.
+
+    The grammar search and the entailments check the candidates against
+    the orders on the constraints, whose number grows faster than
+    exponentially. The grammar info only covers a page of grammars.
+
+    """
+    if func == 'make_grammar_info':
+        num_orders = len(dset.global_stats['grams'])
+    else:
+        num_orders = NUM_STRICT_ORDERS[len(dset.constraints)]
+    return len(dset.candidates) * num_orders
+
+
+def job_version(dset, *params):
+    """Identify the state of the dataset that a job will read.
+
+    Any params the job reads from the dataset besides its content, such
+    as the grammars on the page, are included.
+
+    """
+    return hashlib.sha1(json.dumps([dset.content_hash()] + list(params))
+                        ).hexdigest()
+
+
+def job_key(msg):
+    """Key a job by function, arguments and dataset version.
+
+    The arguments name the dataset and user, so two requests with the same
+    key would compute the same thing, and can be merged into one job.
+
+    """
+    return json.dumps([msg['func'], msg['args'], msg.get('version')])
 
 
 def _calculate_grammars_and_statistics(dset_name, sort_value, classical,
@@ -40,9 +89,11 @@ def _calculate_grammars_and_statistics(dset_name, sort_value, classical,
     gc = GrammarCalculator(dset_name, sort_value, classical,
                            page, username, sort_by, dset_getter)
     gc._get_initial_data()
-    gc._calculate_global_stats()
-    gc._calculate_navbar_info()
-    gc._truncate_grams_for_pagination()
+    if not gc._load_cached_stats():
+        gc._calculate_global_stats()
+        gc._calculate_navbar_info()
+        gc._truncate_grams_for_pagination()
+        gc._cache_stats()
     gc.dset.global_stats_calculated = True
     gc.dset.save()
 
@@ -83,8 +134,8 @@ class GrammarCalculator():
     def _get_correct_grammars(self):
         self.dset.calculate_compatible_grammars()
         sorter = self.dset.get_grammar_sorter()
-        raw_grams = enumerate(self.dset.raw_grammars)
-        return [(i, g) for i, g in raw_grams if sorter(g) == self.sort_value]
+        gram_ids = enumerate(self.dset.grammar_ids)
+        return [[i, g] for i, g in gram_ids if sorter(g) == self.sort_value]
 
     def _set_classical_sort_value(self):
         if self.sort_by == 'size':
@@ -132,7 +183,7 @@ class GrammarCalculator():
         })
 
     def _get_possible_sort_values(self):
-        values = map(self.dset.get_grammar_sorter(), self.dset.raw_grammars)
+        values = map(self.dset.get_grammar_sorter(), self.dset.grammar_ids)
         return sorted(set(values), reverse=self._is_sort_order_reversed())
 
     def _is_sort_order_reversed(self):
@@ -149,7 +200,25 @@ class GrammarCalculator():
         min_ind = self.dset.grammar_navbar['min_ind']
         max_ind = self.dset.grammar_navbar['max_ind']
         self.grams = self.grams[min_ind:max_ind + 1]  # +1 b/c slice syntax
-        self.dset.global_stats['grams'] = str(self.grams)
+        self.dset.global_stats['grams'] = self.grams
+
+    def _cache_params(self):
+        return (self.sort_by, self.sort_value, self.page)
+
+    def _load_cached_stats(self):
+        cached = CachedResult.lookup(self.dset, 'global_stats',
+                                     *self._cache_params())
+        if cached is None:
+            return False
+        self.dset.global_stats = cached['global_stats']
+        self.dset.grammar_navbar = cached['grammar_navbar']
+        return True
+
+    def _cache_stats(self):
+        CachedResult.store(self.dset, 'global_stats', {
+            'global_stats': self.dset.global_stats,
+            'grammar_navbar': self.dset.grammar_navbar
+        }, *self._cache_params())
 
 
 class GrammarInfoMaker():
@@ -161,15 +230,25 @@ class GrammarInfoMaker():
 
     def make_grammar_info(self):
         self._setup_for_making_info()
-        self.dset.grammar_info = self._grammar_info()
+        self.dset.grammar_info = self._cached_grammar_info()
         self.dset.grammar_stats_calculated = True
         self.dset.save()
 
     def _setup_for_making_info(self):
         self.dset = self.dset_getter(self.dset_name, self.username)
-        self.grams = eval(self.dset.global_stats['grams'])
+        self.grams = self.dset.global_stats['grams']
         self.dset.visualize_and_store_grammars([g[0] for g in self.grams])
 
+    def _cached_grammar_info(self):
+        grams_hash = hashlib.sha1(json.dumps(self.grams)).hexdigest()
+        params = (self.dset.sort_by, grams_hash)
+        grammar_info = CachedResult.lookup(self.dset, 'grammar_info', *params)
+        if grammar_info is None:
+            grammar_info = self._grammar_info()
+            CachedResult.store(self.dset, 'grammar_info', grammar_info,
+                               *params)
+        return grammar_info
+
     def _grammar_info(self):
         return [self._single_grammar_info(gram) for gram in self.grams]
 
@@ -199,5 +278,6 @@ class GrammarInfoMaker():
         return {'raw_sum': raw_sum, 'per_sum': percent_sum}
 
     def _make_grammar_filename(self, index):
-        return 'grammar%d.png' % index
+        list_grammar = self.dset.grammars[index].list_grammar
+        return grammar_graph_key(list_grammar) + '.svg'
 
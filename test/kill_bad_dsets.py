@@ -1,5 +1,6 @@
 #! /usr/bin/env python
 from rankomatic.models import Dataset
+from rankomatic.models.results import CachedResult
 
 DB_STR = 'otorder_test'
 
@@ -7,6 +8,7 @@ def delete_bad_dsets():
     bad_dsets = filter(is_bad_dset, Dataset.objects())
     for bad in bad_dsets:
         bad.delete()
+    CachedResult.objects.delete()
 
 
 def is_bad_dset(dset):
@@ -0,0 +1,87 @@
+import cPickle
+import os
+import tempfile
+
+from nose.tools import raises
+from rankomatic.lattice.binary import (MappedLattice, convert_pickle,
+                                       write_lattice, pickle_lattice_path,
+                                       RELATIONS)
+
+
+def convert_to_temp_file(n):
+    fd, path = tempfile.mkstemp(suffix='.lat')
+    os.close(fd)
+    convert_pickle(pickle_lattice_path(n), path, n)
+    return path
+
+
+def load_pickle(n):
+    with open(pickle_lattice_path(n), 'rb') as f:
+        return cPickle.load(f)
+
+
+def test_converted_lattice_matches_pickle():
+    for n in [2, 3, 4]:
+        yield check_converted_lattice_matches_pickle, n
+
+
+def check_converted_lattice_matches_pickle(n):
+    path = convert_to_temp_file(n)
+    try:
+        lattice = load_pickle(n)
+        mapped = MappedLattice(path)
+        assert len(mapped) == len(lattice)
+        assert set(mapped) == set(lattice)
+        for gram in lattice:
+            for rel in RELATIONS:
+                assert mapped[gram][rel] == lattice[gram][rel]
+        mapped.close()
+    finally:
+        os.remove(path)
+
+
+def test_missing_grammar():
+    path = convert_to_temp_file(3)
+    try:
+        mapped = MappedLattice(path)
+        assert frozenset([(1, 2), (2, 1)]) not in mapped
+        assert frozenset([(1, 2)]) in mapped
+        mapped.close()
+    finally:
+        os.remove(path)
+
+
+@raises(ValueError)
+def test_not_a_lattice_file():
+    MappedLattice(pickle_lattice_path(2))
+
+
+def test_write_streamed_rows():
+    masks = [0, 1, 2]
+    rows = {'up': [[0, 1, 2], [1], [2]],
+            'down': [[0], [0, 1], [0, 2]],
+            'max': [[1, 2], [1], [2]]}
+    relations = dict((rel, iter(rows[rel])) for rel in RELATIONS)
+    fd, path = tempfile.mkstemp(suffix='.lat')
+    os.close(fd)
+    try:
+        write_lattice(path, 2, masks, relations)
+        mapped = MappedLattice(path)
+        assert [mapped.mask(i) for i in range(3)] == masks
+        for rel in RELATIONS:
+            for i, row in enumerate(rows[rel]):
+                assert list(mapped.related_indices(rel, i)) == row
+        mapped.close()
+    finally:
+        os.remove(path)
+
+
+@raises(ValueError)
+def test_write_too_few_rows():
+    relations = dict((rel, [[0]]) for rel in RELATIONS)
+    fd, path = tempfile.mkstemp(suffix='.lat')
+    os.close(fd)
+    try:
+        write_lattice(path, 2, [0, 1, 2], relations)
+    finally:
+        os.remove(path)
@@ -0,0 +1,44 @@
+from nose.tools import raises
+from rankomatic.lattice.encoding import (pairs, pair_bit, grammar_to_mask,
+                                         mask_to_grammar, num_pairs,
+                                         grammar_id, grammar_from_id)
+
+
+def test_pairs():
+    assert pairs(3) == [(1, 2), (2, 1), (1, 3), (3, 1), (2, 3), (3, 2)]
+    for n in range(2, 9):
+        assert len(pairs(n)) == num_pairs(n)
+        assert pairs(n)[:num_pairs(n - 1)] == pairs(n - 1)
+
+
+def test_pair_bit():
+    assert pair_bit((1, 2), 3) == 0
+    assert pair_bit((3, 2), 3) == 5
+
+
+def test_round_trip():
+    grammars = [
+        frozenset([]),
+        frozenset([(1, 2), (1, 3), (2, 3)]),
+        frozenset([(1, 2), (2, 3), (1, 3), (1, 4)]),
+        frozenset([(4, 3)])
+    ]
+    for gram in grammars:
+        yield check_round_trip, gram
+
+
+def check_round_trip(gram):
+    mask = grammar_to_mask(gram, 4)
+    assert bin(mask).count('1') == len(gram)
+    assert mask_to_grammar(mask, 4) == gram
+    assert grammar_id(gram) == mask
+    assert grammar_from_id(mask) == gram
+
+
+def test_empty_grammar_is_zero():
+    assert grammar_to_mask(frozenset(), 5) == 0
+
+
+@raises(KeyError)
+def test_pair_out_of_range():
+    grammar_to_mask(frozenset([(1, 4)]), 3)
@@ -0,0 +1,66 @@
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.lattice.entailments import bitset_entailments, erc_entailments
+from rankomatic.lattice.winners import WinnerTable
+from test_search import voweldset, ot_candidates
+
+
+def sorted_entailments(entailments):
+    return dict((k, sorted(v)) for k, v in entailments.iteritems())
+
+
+def test_global_entailments():
+    entailments = sorted_entailments(
+        bitset_entailments(WinnerTable(voweldset, 4))
+    )
+    assert entailments[('ovea', 'o-vee')] == [('ovea', 'o-vee')]
+    assert entailments[('rasia', 'ra-sii')] == [
+        ('idea', 'i-dee'), ('lasi-a', 'la-sii'),
+        ('ovea', 'o-vee'), ('rasia', 'ra-sii')
+    ]
+    assert len(entailments) == len(voweldset)
+
+
+def test_apriori_entailments():
+    table = WinnerTable(voweldset, 4)
+    entailments = bitset_entailments(table, grammar_id([(2, 1)]))
+    assert ('idea', 'i-de-a') in entailments[('rasia', 'ra-si-a')]
+    assert ('idea', 'i-de-a') not in bitset_entailments(table)[
+        ('rasia', 'ra-si-a')]
+
+
+def test_never_optimal_candidates_are_left_out():
+    candidates = ot_candidates([
+        ('a', 'b', [0, 1, 0], True),
+        ('a', 'c', [1, 1, 0], False)
+    ])
+    entailments = bitset_entailments(WinnerTable(candidates, 3))
+    assert entailments == {('a', 'b'): [('a', 'b')]}
+
+
+def test_erc_entailments_match_bitsets():
+    table = WinnerTable(voweldset, 4)
+    for apriori in [frozenset(), frozenset([(2, 1)]),
+                    frozenset([(2, 1), (4, 3)])]:
+        yield (check_erc_entailments, table, apriori)
+
+
+def check_erc_entailments(table, apriori):
+    expected = bitset_entailments(table, grammar_id(apriori))
+    actual = erc_entailments(voweldset, 4, apriori)
+    assert sorted_entailments(actual) == sorted_entailments(expected)
+
+
+def test_erc_entailments_leave_out_never_optimal_candidates():
+    candidates = ot_candidates([
+        ('a', 'b', [0, 1, 0], True),
+        ('a', 'c', [1, 1, 0], False)
+    ])
+    assert erc_entailments(candidates, 3) == {('a', 'b'): [('a', 'b')]}
+
+
+def test_erc_entailments_progress():
+    reports = []
+    entailments = erc_entailments(voweldset, 4,
+                                  progress=lambda *args: reports.append(args))
+    total = len(entailments)
+    assert reports == [(done, total) for done in range(1, total + 1)]
@@ -0,0 +1,40 @@
+from rankomatic.lattice.ercs import (erc, candidate_ercs, grammar_ercs,
+                                     consistent, entails)
+
+
+def vvec(*violations):
+    return dict((i + 1, v) for i, v in enumerate(violations))
+
+
+def test_erc():
+    assert erc(vvec(0, 1, 1, 0), vvec(1, 0, 0, 1), 4) == (0b1001, 0b0110)
+    assert erc(vvec(0, 0, 0), vvec(0, 0, 0), 3) == (0, 0)
+
+
+def test_candidate_ercs_skip_ties():
+    cands = [
+        {'input': 'a', 'output': 'b', 'violation_vector': vvec(1, 0)},
+        {'input': 'a', 'output': 'c', 'violation_vector': vvec(0, 1)},
+        {'input': 'a', 'output': 'd', 'violation_vector': vvec(0, 1)}
+    ]
+    ercs = candidate_ercs(cands, 2)
+    assert ercs[('a', 'b')] == [(0b10, 0b01), (0b10, 0b01)]
+    assert ercs[('a', 'c')] == [(0b01, 0b10)]
+
+
+def test_grammar_ercs():
+    assert grammar_ercs([(1, 2)]) == [(0b10, 0b01)]
+
+
+def test_consistent():
+    assert consistent([], 3)
+    assert consistent([(0b001, 0b010), (0b010, 0b100)], 3)
+    assert not consistent([(0b001, 0b010), (0b010, 0b001)], 3)
+    assert not consistent([(0, 0b001)], 3)
+
+
+def test_entails():
+    chain = [(0b001, 0b010), (0b010, 0b100)]
+    assert entails(chain, (0b001, 0b100), 3)
+    assert not entails(chain, (0b100, 0b001), 3)
+    assert entails(chain, (0b001, 0), 3)
@@ -0,0 +1,52 @@
+import cPickle
+
+from rankomatic.lattice.binary import pickle_lattice_path
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.lattice.extensions import (count_linear_extensions,
+                                           linear_extensions)
+from test_search import voweldset, three_constraints
+
+
+def test_matches_lattice_max():
+    for n in [2, 3, 4]:
+        with open(pickle_lattice_path(n), 'rb') as f:
+            lattice = cPickle.load(f)
+        for gram in lattice:
+            num_max = len(lattice[gram]['max'])
+            assert count_linear_extensions(gram, n) == num_max
+
+
+def test_empty_grammar():
+    assert count_linear_extensions(frozenset(), 8) == 40320
+
+
+def test_total_order():
+    gram = frozenset([(1, 2), (2, 3), (1, 3)])
+    assert count_linear_extensions(gram, 3) == 1
+
+
+def test_counter_matches_function():
+    counter = linear_extensions(4)
+    with open(pickle_lattice_path(4), 'rb') as f:
+        lattice = cPickle.load(f)
+    for gram in lattice:
+        num_extensions = count_linear_extensions(gram, 4)
+        assert counter.count(grammar_id(gram)) == num_extensions
+
+
+def test_num_cots_by_cand():
+    gram = frozenset([(3, 1), (2, 1)])
+    num_cots = linear_extensions(4).num_cots_by_cand(voweldset,
+                                                     grammar_id(gram))
+    assert num_cots == {
+        ('ovea', 'o-ve-a'): 4, ('ovea', 'o-vee'): 4,
+        ('idea', 'i-de-a'): 8, ('idea', 'i-dee'): 0,
+        ('lasi-a', 'la-si-a'): 5, ('lasi-a', 'la-sii'): 3,
+        ('rasia', 'ra-si-a'): 8, ('rasia', 'ra-sii'): 0
+    }
+
+
+def test_num_cots_by_cand_without_grammar():
+    num_cots = linear_extensions(3).num_cots_by_cand(three_constraints, 0)
+    # b wins exactly when C2 dominates both C1 and C3
+    assert num_cots == {('a', 'b'): 2, ('a', 'c'): 4}
@@ -0,0 +1,106 @@
+from rankomatic.lattice import search as search_module
+from rankomatic.lattice.search import CompatibleGrammarSearch
+
+
+def ot_candidates(rows):
+    return [{
+        'input': inp,
+        'output': out,
+        'optimal': optimal,
+        'violation_vector': dict((i + 1, v) for i, v in enumerate(vvec))
+    } for inp, out, vvec, optimal in rows]
+
+
+voweldset = ot_candidates([
+    ('ovea', 'o-ve-a', [0, 1, 1, 0], True),
+    ('ovea', 'o-vee', [0, 0, 0, 1], True),
+    ('idea', 'i-de-a', [0, 1, 1, 0], True),
+    ('idea', 'i-dee', [1, 0, 0, 1], False),
+    ('lasi-a', 'la-si-a', [0, 0, 1, 0], True),
+    ('lasi-a', 'la-sii', [0, 0, 0, 1], True),
+    ('rasia', 'ra-si-a', [0, 0, 1, 0], True),
+    ('rasia', 'ra-sii', [1, 0, 0, 1], False)
+])
+
+voweldset_grammars = set([
+    frozenset([(3, 1), (2, 3), (2, 4), (2, 1)]),
+    frozenset([(3, 2), (3, 1), (2, 1)]), frozenset([(3, 1), (2, 4), (2, 1)]),
+    frozenset([(2, 3), (3, 1), (4, 1), (2, 1)]), frozenset([(3, 1), (2, 1)]),
+    frozenset([(3, 1), (4, 1), (2, 1)]), frozenset([(3, 1), (2, 4)]),
+    frozenset([(3, 1), (2, 3), (2, 1)]),
+    frozenset([(3, 1), (4, 1), (2, 4), (2, 1)]),
+    frozenset([(2, 3), (3, 1), (4, 1), (2, 4), (2, 1)]),
+    frozenset([(3, 2), (3, 1), (4, 1), (2, 1)])
+])
+
+three_constraints = ot_candidates([
+    ('a', 'b', [1, 0, 1], True),
+    ('a', 'c', [0, 1, 0], False)
+])
+
+
+def search(candidates, n, **kwargs):
+    return set(CompatibleGrammarSearch(candidates, n, **kwargs).grammars())
+
+
+def test_poot_grammars():
+    assert search(voweldset, 4) == voweldset_grammars
+
+
+def test_no_cots_with_variation():
+    assert search(voweldset, 4, classical=True) == set()
+
+
+def test_three_constraints():
+    assert search(three_constraints, 3) == set([
+        frozenset([(1, 2), (3, 2), (1, 3)]),
+        frozenset([(1, 2), (3, 2), (3, 1)]),
+        frozenset([(1, 2), (3, 2)])
+    ])
+    assert search(three_constraints, 3, classical=True) == set([
+        frozenset([(1, 2), (3, 2), (1, 3)]),
+        frozenset([(1, 2), (3, 2), (3, 1)])
+    ])
+
+
+def test_apriori():
+    apriori = frozenset([(1, 3)])
+    assert search(three_constraints, 3, apriori=apriori) == set([
+        frozenset([(1, 2), (3, 2), (1, 3)])
+    ])
+    implied = frozenset([(3, 1)])
+    assert search(voweldset, 4, apriori=implied) == voweldset_grammars
+    assert search(voweldset, 4, apriori=frozenset([(1, 3)])) == set()
+
+
+def test_no_optimal_candidate():
+    cands = ot_candidates([('a', 'b', [1, 0, 0, 0, 0], False),
+                           ('a', 'c', [0, 1, 0, 0, 0], False)])
+    assert search(cands, 5) == set()
+
+
+def test_five_constraints():
+    cands = ot_candidates([('a', 'b', [0, 0, 0, 0, 1], True),
+                           ('a', 'c', [1, 0, 0, 0, 0], False)])
+    grammars = search(cands, 5)
+    assert grammars
+    for gram in grammars:
+        assert (5, 1) in gram
+
+
+def test_progress():
+    reports = []
+    grammar_search = CompatibleGrammarSearch(
+        voweldset, 4, progress=lambda scanned, found: reports.append(
+            (scanned, found))
+    )
+    progress_steps = search_module.PROGRESS_STEPS
+    search_module.PROGRESS_STEPS = 1
+    try:
+        grammars = list(grammar_search.grammars())
+    finally:
+        search_module.PROGRESS_STEPS = progress_steps
+    assert len(reports) > 1
+    assert reports[-1] == (1.0, len(grammars))
+    assert reports == sorted(reports)
+    assert abs(grammar_search.scanned - 1.0) < 1e-9
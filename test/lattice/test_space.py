@@ -0,0 +1,53 @@
+import cPickle
+
+from rankomatic.lattice.binary import pickle_lattice_path, RELATIONS
+from rankomatic.lattice.cache import LRUCache
+from rankomatic.lattice.space import (OrderSpace, strict_orders, bit_indices,
+                                      popcount)
+
+
+def test_number_of_strict_orders():
+    expected = {1: 1, 2: 3, 3: 19, 4: 219, 5: 4231}
+    for n, num_orders in expected.iteritems():
+        assert len(set(strict_orders(n))) == num_orders
+
+
+def test_space_matches_pickled_lattice():
+    for n in [2, 3, 4]:
+        yield check_space_matches_pickled_lattice, n
+
+
+def check_space_matches_pickled_lattice(n):
+    with open(pickle_lattice_path(n), 'rb') as f:
+        lattice = cPickle.load(f)
+    space = OrderSpace(n)
+    assert set(space) == set(lattice)
+    for gram in lattice:
+        for rel in RELATIONS:
+            assert space[gram][rel] == lattice[gram][rel]
+
+
+def test_counts():
+    space = OrderSpace(5)
+    empty = space.index(0)
+    assert space.count('max', empty) == 120
+    assert space.count('up', empty) == 4231
+    assert space.count('down', empty) == 1
+
+
+def test_bit_indices():
+    assert bit_indices(0) == []
+    assert bit_indices(0b101001) == [0, 3, 5]
+    assert popcount(0b101001) == 3
+
+
+def test_lru_cache_evicts_oldest():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['a']
+    cache['c'] = 3
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get_or_compute('d', lambda: 4) == 4
+    assert len(cache) == 2
@@ -0,0 +1,44 @@
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.lattice.extensions import linear_extensions
+from rankomatic.lattice.space import popcount
+from rankomatic.lattice.winners import WinnerTable, total_orders
+from test_search import voweldset, three_constraints, ot_candidates
+
+
+def test_total_orders():
+    orders = total_orders(4)
+    assert len(orders) == 24
+    assert orders.extensions(0) == orders.all
+    assert popcount(orders.ranked_above(2, 1)) == 12
+
+
+def test_count_matches_linear_extensions():
+    table = WinnerTable(voweldset, 4)
+    grams = [frozenset(), frozenset([(3, 1), (2, 1)]),
+             frozenset([(1, 2), (2, 3), (1, 3), (1, 4)])]
+    for gram in grams:
+        mask = grammar_id(gram)
+        assert table.count(mask) == linear_extensions(4).count(mask)
+
+
+def test_num_cots_by_cand():
+    table = WinnerTable(voweldset, 4)
+    mask = grammar_id(frozenset([(3, 1), (2, 1)]))
+    expected = linear_extensions(4).num_cots_by_cand(voweldset, mask)
+    assert table.num_cots_by_cand(mask) == expected
+
+
+def test_harmonically_bounded_candidate_never_wins():
+    candidates = ot_candidates([
+        ('a', 'b', [0, 1, 0], True),
+        ('a', 'c', [1, 1, 0], False),
+        ('a', 'd', [0, 1, 0], True)
+    ])
+    table = WinnerTable(candidates, 3)
+    assert table.wins[('a', 'c')] == 0
+    assert table.wins[('a', 'b')] == table.wins[('a', 'd')] == 2 ** 6 - 1
+
+
+def test_three_constraints():
+    table = WinnerTable(three_constraints, 3)
+    assert table.num_cots_by_cand(0) == {('a', 'b'): 2, ('a', 'c'): 4}
@@ -1,5 +1,6 @@
 import mock
 import gridfs
+import datetime
 from copy import deepcopy
 from nose.tools import raises
 
@@ -8,6 +9,8 @@ import test.structures.structures as structures
 from rankomatic import models, db
 from test.test_tools import delete_bad_datasets
 from rankomatic.models.grammar import GrammarList
+from rankomatic.models.graphs import GrammarGraph, RenderedGraph
+from rankomatic.models.results import CachedResult
 
 
 class TestDataset(object):
@@ -21,16 +24,23 @@ class TestDataset(object):
         }
         self.d = models.Dataset(data=self.data, data_is_from_form=False)
         self.d.classical = False
-        self.entailments_fname = "".join([self.d.name, "/", 'entailments.png'])
-        self.grammar_format_str = self.d.name + "/grammar%d.png"
+        self.entailments_fname = "".join([self.d.name, "/", 'entailments.dot'])
         self.fs = gridfs.GridFS(db.get_pymongo_db(), collection='tmp')
+        self.grammar_fs = gridfs.GridFS(db.get_pymongo_db(),
+                                        collection=GrammarGraph.FS_COLL)
 
     def tearDown(self):
         pymongodb = db.get_pymongo_db()
         pymongodb.tmp.files.drop()
         pymongodb.tmp.chunks.drop()
+        pymongodb[GrammarGraph.FS_COLL].files.drop()
+        pymongodb[GrammarGraph.FS_COLL].chunks.drop()
         delete_bad_datasets()
 
+    def get_grammar_graph(self, index):
+        filename = self.d.grammars[index].graph().filename
+        return self.grammar_fs.get_last_version(filename=filename)
+
     def test_bare_constructor(self):
         d = models.Dataset()
         assert d.upload_date
@@ -276,12 +286,74 @@ class TestDataset(object):
         assert len(structures.compatible_poot_grammars) == len(self.d.grammars)
         assert mock_get_grammars.called_with(False)
 
+    @mock.patch('ot.poot.PoOT.get_grammars',
+                return_value=compatible_poot_grammars)
+    def test_copies_share_compatible_grammars(self, mock_get_grammars):
+        self.d.calculate_compatible_grammars()
+        copy = models.Dataset(data=deepcopy(self.data),
+                              data_is_from_form=False)
+        copy.name = 'voweldset-copy'
+        copy.classical = False
+        copy.calculate_compatible_grammars()
+        assert mock_get_grammars.call_count == 1
+        assert copy.grammar_ids == self.d.grammar_ids
+
+    def test_content_hash(self):
+        copy = models.Dataset(data=deepcopy(self.data),
+                              data_is_from_form=False)
+        copy.name = 'voweldset-copy'
+        copy.user = 'john'
+        copy.classical = False
+        assert copy.content_hash() == self.d.content_hash()
+        copy.apriori_ranking = []
+        assert copy.content_hash() != self.d.content_hash()
+        copy.apriori_ranking = self.data['apriori_ranking']
+        copy.classical = True
+        assert copy.content_hash() != self.d.content_hash()
+
+    def test_content_hash_without_apriori(self):
+        copy = models.Dataset(data=deepcopy(self.data),
+                              data_is_from_form=False)
+        copy.apriori_ranking = []
+        assert copy.content_hash() != self.d.content_hash()
+        assert (copy.content_hash(apriori=False) ==
+                self.d.content_hash(apriori=False))
+
     def test_calculate_compatible_grammars_no_grammars(self):
         self.data['candidates'] = ot.data.no_rankings
         self.d = models.Dataset(self.data, False)
         self.d.calculate_compatible_grammars()
         assert self.d.grammars == []
 
+    def test_calculate_compatible_grammars_five_constraints(self):
+        data = {
+            'constraints': ['C1', 'C2', 'C3', 'C4', 'C5'],
+            'candidates': [
+                {
+                    'input': 'a',
+                    'output': 'b',
+                    'optimal': True,
+                    'violation_vector': {1: 0, 2: 0, 3: 0, 4: 0, 5: 1}
+                },
+                {
+                    'input': 'a',
+                    'output': 'c',
+                    'optimal': False,
+                    'violation_vector': {1: 1, 2: 0, 3: 0, 4: 0, 5: 0}
+                }
+            ],
+            'name': 'blank',
+            'apriori_ranking': [['C2', 'C3'], ['C3', 'C4']]
+        }
+        d = models.Dataset(data=data, data_is_from_form=False)
+        d.classical = True
+        d.calculate_compatible_grammars()
+        assert d.num_total_cots() == 120
+        assert d.num_total_poots() == 4231
+        assert len(d.raw_grammars) == 10
+        for gram in d.raw_grammars:
+            assert (5, 1) in gram
+
     def test_grammar_to_string(self):
         self.d.sort_by = 'size'
         self.d.calculate_compatible_grammars()
@@ -341,6 +413,18 @@ class TestDataset(object):
             for entailed in entaileds:
                 assert entailed not in self.d.global_entailments[entails]
 
+    def test_changing_apriori_reuses_global_entailments(self):
+        self.d.apriori_ranking = []
+        self.d.calculate_entailments()
+        self.d.apriori_ranking = self.data['apriori_ranking']
+        self.d.entailments_calculated = False
+        with mock.patch.object(models.Dataset,
+                               '_calculate_global_entailments') as mock_calc:
+            self.d.calculate_entailments()
+        assert not mock_calc.called
+        assert self.d.global_entailments == structures.global_entailments
+        assert 'idea, i-dee' in self.d.apriori_entailments
+
     @raises(gridfs.NoFile)
     def test_visualize_and_store_entailments_no_entailments(self):
         data = {
@@ -370,13 +454,13 @@ class TestDataset(object):
     def test_visualize_and_store_grammars_no_indices_cot(self):
         self.d.calculate_compatible_grammars()
         self.d.visualize_and_store_grammars([])
-        self.fs.get_last_version(filename=(self.grammar_format_str % 0))
+        self.get_grammar_graph(0)
 
     @raises(gridfs.NoFile)
     def test_visualize_and_store_grammars_no_indices_poot(self):
         self.d.calculate_compatible_grammars()
         self.d.visualize_and_store_grammars([])
-        self.fs.get_last_version(filename=(self.grammar_format_str % 0))
+        self.get_grammar_graph(0)
 
     lat4 = set([
         frozenset([(4, 2), (1, 3), (4, 3)]), frozenset([(1, 2), (3, 2), (3, 1), (3, 4), (1, 4)]), frozenset([(3, 1), (2, 1), (2, 3), (4, 3), (4, 2), (4, 1)]), frozenset([(3, 1), (3, 4), (2, 1)]), frozenset([(4, 2), (3, 1), (4, 1), (2, 1)]), frozenset([(1, 2), (4, 3)]), frozenset([(3, 1), (4, 1), (2, 4), (2, 1)]), frozenset([(3, 1), (3, 4), (2, 4), (2, 1)]), frozenset([(2, 3), (4, 2), (4, 1), (2, 1), (4, 3)]), frozenset([(1, 3), (2, 1), (2, 3), (4, 3), (4, 2), (4, 1)]), frozenset([(1, 2), (1, 3), (1, 4), (4, 3)]), frozenset([(1, 2), (1, 3), (1, 4), (2, 3), (4, 3), (4, 2)]), frozenset([(3, 1), (4, 1), (4, 3)]), frozenset([(3, 4), (1, 4)]), frozenset([(1, 3)]), frozenset([(2, 3), (3, 4), (2, 1), (1, 4), (2, 4)]), frozenset([(1, 2), (4, 2), (1, 3), (1, 4)]), frozenset([(3, 1), (2, 1)]), frozenset([(1, 3), (2, 3), (1, 4), (4, 3), (2, 4)]), frozenset([(1, 2), (4, 2), (1, 3), (2, 3), (4, 3)]), frozenset([(1, 2), (2, 4), (1, 4)]), frozenset([(4, 2), (3, 2), (3, 1)]), frozenset([(2, 3), (2, 1), (1, 4), (2, 4)]), frozenset([(2, 3), (4, 1), (2, 1), (4, 3)]), frozenset([(1, 2), (4, 2), (1, 3), (1, 4), (4, 3)]), frozenset([(1, 2), (3, 2), (1, 3)]), frozenset([(1, 2), (3, 2), (1, 3), (1, 4), (3, 4), (2, 4)]), frozenset([(4, 1)]), frozenset([(1, 2), (3, 2), (3, 1), (4, 3), (4, 2), (4, 1)]), frozenset([(4, 2)]), frozenset([(1, 3), (2, 4)]), frozenset([(2, 3), (1, 3), (4, 1), (2, 1), (4, 3)]), frozenset([(1, 3), (2, 3), (2, 1), (1, 4), (2, 4)]), frozenset([(1, 2), (1, 3), (2, 3), (1, 4), (4, 3)]), frozenset([(2, 3), (4, 2), (4, 1), (4, 3)]), frozenset([(4, 2), (3, 1), (4, 1), (2, 1), (4, 3)]), frozenset([(2, 1), (1, 4), (2, 4)]), frozenset([(1, 2), (4, 2)]), frozenset([(1, 3), (2, 1), (2, 3), (4, 3), (4, 1), (2, 4)]), frozenset([(2, 4), (1, 4)]), frozenset([(3, 4), (2, 4), (1, 4)]), frozenset([(1, 2), (3, 4)]), frozenset([(2, 3), (2, 4)]), frozenset([(3, 1), (2, 1), (2, 3), (1, 4), (3, 4), (2, 4)]), frozenset([(1, 2), (4, 2), (3, 2), (1, 4)]), frozenset([(4, 2), (4, 1)]), frozenset([(3, 2)]), frozenset([(3, 4), (4, 2), (3, 2), (3, 1), (4, 1)]), frozenset([(1, 2), (4, 2), (3, 2), (4, 1)]), frozenset([(1, 3), (2, 3), (4, 3)]), frozenset([(1, 2), (4, 2), (3, 2)]), frozenset([(4, 2), (1, 3), (2, 3), (4, 3)]), frozenset([(2, 1), (4, 3)]), frozenset([(4, 2), (4, 1), (2, 1), (4, 3)]), frozenset([(4, 2), (3, 1), (4, 1)]), frozenset([(3, 2), (3, 1), (3, 4), (2, 4), (1, 4)]), frozenset([(3, 1), (2, 3), (2, 1)]), frozenset([(1, 2), (4, 2), (3, 2), (3, 1), (3, 4)]), frozenset([(1, 2), (3, 2), (3, 4)]), frozenset([(1, 2), (1, 3), (2, 3), (2, 4), (1, 4)]), frozenset([(2, 4)]), frozenset([(3, 2), (3, 1), (4, 1)]), frozenset([(4, 2), (1, 3)]), frozenset([(1, 2), (3, 2), (3, 1), (1, 4), (4, 2), (3, 4)]), frozenset([(3, 4), (2, 4), (2, 1)]), frozenset([(1, 2), (4, 2), (4, 1)]), frozenset([(1, 2), (3, 2), (3, 4), (2, 4), (1, 4)]), frozenset([(4, 2), (3, 2)]), frozenset([(4, 2), (4, 1), (2, 1)]), frozenset([(3, 4), (2, 1), (1, 4), (2, 4)]), frozenset([(2, 4), (2, 1)]), frozenset([(2, 3), (1, 4)]), frozenset([(3, 2), (3, 1), (4, 1), (2, 1)]), frozenset([(3, 1), (3, 4), (2, 1), (1, 4), (2, 4)]), frozenset([(2, 3), (3, 1), (3, 4), (2, 4), (2, 1)]), frozenset([(2, 3), (2, 4), (1, 4)]), frozenset([(3, 1), (3, 4)]), frozenset([(2, 3), (3, 4), (2, 4), (2, 1)]), frozenset([(4, 1), (2, 1), (4, 3)]), frozenset([(1, 2)]), frozenset([(3, 2), (3, 4), (2, 4)]), frozenset([(4, 1), (4, 3)]), frozenset([(4, 1), (3, 1), (3, 4), (2, 1)]), frozenset([(1, 2), (4, 2), (1, 3)]), frozenset([(4, 2), (4, 3)]), frozenset([(1, 3), (2, 3), (2, 4), (4, 3)]), frozenset([(1, 2), (1, 3), (1, 4), (2, 3), (4, 3), (2, 4)]), frozenset([(3, 4), (3, 2), (3, 1), (4, 1), (2, 1)]), frozenset([(4, 1), (2, 1)]), frozenset([(1, 2), (1, 3), (2, 3), (4, 3), (4, 2), (4, 1)]), frozenset([(1, 3), (2, 3), (1, 4), (4, 3)]), frozenset([(1, 2), (1, 3), (2, 4), (1, 4)]), frozenset([(1, 2), (1, 3), (4, 3)]), frozenset([(2, 3), (4, 1), (2, 1), (4, 3), (2, 4)]),
@@ -395,8 +479,7 @@ class TestDataset(object):
         assert mock_get_grammars.called_with(False)
         self.d.visualize_and_store_grammars(range(5))
         for i in range(5):
-            assert self.fs.get_last_version(filename=(
-                self.grammar_format_str % i))
+            assert self.get_grammar_graph(i)
 
     visualized_poot_grammars = set([
         frozenset([(3, 1), (2, 3), (2, 4), (2, 1)]),
@@ -416,14 +499,13 @@ class TestDataset(object):
         self.d.calculate_compatible_grammars()
         self.d.visualize_and_store_grammars(range(5))
         for i in range(5):
-            assert self.fs.get_last_version(filename=(
-                self.grammar_format_str % i))
+            assert self.get_grammar_graph(i)
         assert mock_get_grammars.called_with(False)
 
     def test_get_cot_stats_by_cand(self):
         self.d.sort_by = 'size'
         self.d.calculate_compatible_grammars()
-        stats = self.d.get_cot_stats_by_cand(self.d.raw_grammars[0])
+        stats = self.d.get_cot_stats_by_cand(self.d.grammar_ids[0])
         assert stats == structures.cot_stats_by_cand
 
     def test_sort_by(self):
@@ -449,19 +531,21 @@ class TestDataset(object):
     ])
 
     @mock.patch('ot.poot.PoOT.get_grammars', return_value=change_sort_grammars)
-    def test_changing_sort_by_changes_graph_images(self, mock_get_grammars):
+    def test_changing_sort_by_reuses_graph_images(self, mock_get_grammars):
         assert self.d.sort_by == 'rank_volume'
         self.d.calculate_compatible_grammars()
         assert mock_get_grammars.called_with(False)
-        self.d.visualize_and_store_grammars([0])
-        fname = 'voweldset/grammar0.png'
-        old_image_hash = self.fs.get_last_version(filename=fname).md5
+        indices = range(len(self.d.grammars))
+        self.d.visualize_and_store_grammars(indices)
+        num_files = len(self.grammar_fs.list())
         self.d.sort_by = 'size'
         self.d.calculate_compatible_grammars()
         assert mock_get_grammars.called_with(False)
-        self.d.visualize_and_store_grammars([0])
-        new_image_hash = self.fs.get_last_version(filename=fname).md5
-        assert not old_image_hash == new_image_hash
+        with mock.patch('rankomatic.models.graphs.GrammarGraph.make_graph'
+                        ) as mock_make_graph:
+            self.d.visualize_and_store_grammars(indices)
+        assert not mock_make_graph.called
+        assert len(self.grammar_fs.list()) == num_files
 
     @raises(gridfs.NoFile)
     def test_remove_old_files(self):
@@ -472,11 +556,95 @@ class TestDataset(object):
         self.d.remove_old_files()
         self.fs.get_last_version(filename=self.entailments_fname)
 
+    def test_remove_old_files_keeps_other_datasets(self):
+        copy = models.Dataset(data=deepcopy(self.data),
+                              data_is_from_form=False)
+        copy.name = 'voweldset-copy'
+        for dset in [self.d, copy]:
+            dset.calculate_entailments()
+            dset.visualize_and_store_entailments()
+        RenderedGraph(self.d.name + '/entailments', 'png').read()
+        self.d.remove_old_files()
+        filenames = self.fs.list()
+        assert 'voweldset-copy/entailments.dot' in filenames
+        assert all(f.startswith('voweldset-copy/') for f in filenames)
+        pymongodb = db.get_pymongo_db()
+        assert pymongodb.tmp.chunks.count() == len(filenames)
+
+    def test_touch(self):
+        self.d.save()
+        self.d.touch()
+        stale = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        self.d.last_access = stale
+        self.d.save()
+        self.d.touch()
+        stored = models.Dataset.objects.get(id=self.d.id)
+        assert stored.last_access > stale
+
+    def test_remove_expired(self):
+        protected = models.Dataset.objects(
+            name__in=models.dataset.PROTECTED_DATASETS).count()
+        fresh = models.Dataset(data=deepcopy(self.data),
+                               data_is_from_form=False)
+        fresh.name = 'voweldset-fresh'
+        for dset in [self.d, fresh]:
+            dset.calculate_compatible_grammars()
+            dset.calculate_entailments()
+            dset.visualize_and_store_entailments()
+        self.d.last_access = (datetime.datetime.utcnow() -
+                              models.dataset.GUEST_DATASET_TTL * 2)
+        self.d.save()
+        expired_list = self.d._grammars.id
+        assert models.Dataset.remove_expired() == 1
+        assert not models.Dataset.objects(name='voweldset').count()
+        assert models.Dataset.objects(name='voweldset-fresh').count() == 1
+        assert models.Dataset.objects(
+            name__in=models.dataset.PROTECTED_DATASETS).count() == protected
+        assert not GrammarList.objects(id=expired_list).count()
+        assert self.fs.list() == ['voweldset-fresh/entailments.dot']
+
+    def test_remove_expired_backfills_last_access(self):
+        self.d.save()
+        collection = models.Dataset._get_collection()
+        collection.update({'_id': self.d.id},
+                          {'$unset': {'last_access': 1}})
+        assert models.Dataset.remove_expired() == 0
+        assert 'last_access' in collection.find_one({'_id': self.d.id})
+
+    def test_delete_keeps_cached_results(self):
+        self.d.save()
+        self.d.calculate_compatible_grammars()
+        num_results = CachedResult.objects.count()
+        assert num_results
+        self.d.delete()
+        assert CachedResult.objects.count() == num_results
+
+    @mock.patch('ot.poot.PoOT.get_grammars', return_value=change_sort_grammars)
+    def test_progress(self, mock_get_grammars):
+        self.d.progress = mock.Mock()
+        self.d.calculate_compatible_grammars()
+        self.d.progress.assert_called_with(
+            'grammars', scanned=1.0, found=len(self.change_sort_grammars))
+        self.d.visualize_and_store_grammars([0])
+        self.d.progress.assert_called_with('graphs', done=1, total=1)
+        self.d.calculate_entailments()
+        self.d.progress.assert_called_with('apriori_entailments',
+                                           done=mock.ANY, total=mock.ANY)
+
     def test_num_compatible_poots(self):
         self.d.apriori_ranking = []
         self.d.calculate_compatible_grammars()
         assert self.d.num_compatible_poots() == 11
 
+    @mock.patch('ot.poot.PoOT.get_grammars')
+    def test_no_lattice_available(self, mock_get_grammars):
+        self.d.apriori_ranking = []
+        self.d.lattice_available = False
+        self.d.calculate_compatible_grammars()
+        assert not mock_get_grammars.called
+        assert self.d.num_compatible_poots() == 11
+        assert self.d.num_total_poots() == 219
+
     def test_num_total_poots(self):
         assert self.d.num_total_poots() == 219
 
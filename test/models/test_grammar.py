@@ -1,6 +1,8 @@
 import mock
+from rankomatic.lattice.encoding import grammar_id
 from rankomatic.models import Dataset
-from rankomatic.models.grammar import Grammar
+from rankomatic.models.grammar import (Grammar, GrammarList, RawGrammar,
+                                       RawGrammarTable)
 
 
 grammars = [
@@ -48,10 +50,25 @@ def check_frozenset_constructor(i):
     g = Grammar(gram, dset)
 
     assert g.raw_grammar == gram
+    assert g.grammar_id == grammar_id(gram)
     assert g.list_grammar == list_grammars[i]
     assert g.string == g_strings[i]
 
 
+def test_grammar_id_constructor():
+    for i in range(4):
+        yield check_grammar_id_constructor, i
+
+
+def check_grammar_id_constructor(i):
+    dset = Dataset.objects.get(name="Kiparsky")
+    g = Grammar(dataset=dset, gram_id=grammar_id(grammars[i]))
+
+    assert g.grammar_id == grammar_id(grammars[i])
+    assert g.raw_grammar == grammars[i]
+    assert g.list_grammar == list_grammars[i]
+
+
 def test_list_constructor():
     for i in range(4):
         yield check_list_constructor, i
@@ -72,7 +89,7 @@ def check_list_constructor(i):
 def check_visualize(i, mock_visualize):
     dset = Dataset.objects.get(name="Kiparsky")
     gram = Grammar(grammars[i], dset)
-    gram.visualize("Kiparsky", i)
+    gram.visualize()
     assert mock_visualize.called
 
 
@@ -80,3 +97,27 @@ def test_raw_grammar_from_db():
     dset = Dataset.objects.get(name="Kiparsky")
     gram = dset.grammars[-1]
     assert gram.raw_grammar == frozenset([(3, 1)])
+
+
+def test_grammar_list_round_trip():
+    dset = Dataset.objects.get(name="Kiparsky")
+    gram_ids = [grammar_id(g) for g in grammars]
+    grammar_list = GrammarList(grammars=Grammar.from_ids(gram_ids, dset))
+    grammar_list.save()
+    try:
+        loaded = GrammarList.objects.get(id=grammar_list.id)
+        assert loaded.grammar_ids() == gram_ids
+        assert [g.raw_grammar for g in loaded.grammars] == grammars
+    finally:
+        grammar_list.delete()
+
+
+def test_raw_grammar_table_registers_new_grammars():
+    table = RawGrammarTable()
+    gram = frozenset([(1, 8), (2, 8)])  # beyond the installed grammars
+    ref = table.refs([grammar_id(gram)])[0]
+    try:
+        assert RawGrammar.objects.get(id=ref.id).grammar == grammar_id(gram)
+        assert RawGrammarTable().grammar_ids([ref.id]) == [grammar_id(gram)]
+    finally:
+        RawGrammar.objects(id=ref.id).delete()
@@ -1,8 +1,17 @@
 import gridfs
+import hashlib
 import mock
 
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
 from nose.tools import assert_raises, raises, with_setup
 from rankomatic.models.graphs import GridFSGraph, EntailmentGraph, GrammarGraph
+from rankomatic.models.graphs import reduce_graph, transitive_reduction
+from rankomatic.models.graphs import RenderedGraph, render, visualize_all
+from rankomatic.models.graphs import render_filename
+from rankomatic.models.graphs import grammar_graph_key, remove_dataset_graphs
+from rankomatic.models.graphs import remove_expired_grammar_graphs
+from rankomatic.models.graphs import GRAMMAR_GRAPH_TTL
 from test.structures import structures as structs
 from rankomatic import db
 
@@ -18,6 +27,12 @@ def erase_temp_files():
         fs.delete(fs.get_last_version(filename)._id)
 
 
+def erase_grammar_graphs():
+    pymongodb = db.get_pymongo_db()
+    pymongodb[GrammarGraph.FS_COLL].files.drop()
+    pymongodb[GrammarGraph.FS_COLL].chunks.drop()
+
+
 def raise_no_file(*args, **kwargs):
     raise gridfs.NoFile
 
@@ -56,12 +71,153 @@ def test_gridfs_graph_visualize_success():
 
 
 @with_setup(no_setup, erase_temp_files)
-@mock.patch('pygraphviz.AGraph.draw')
-def test_gridfs_graph_visualize_already_vizualized(mock_draw):
+def test_gridfs_graph_visualize_already_vizualized():
     with mock.patch('gridfs.GridFS.get_last_version'):
         scg = SubclassGraph(dset_name='temp', basename='test')
-        scg.visualize()
-        assert not mock_draw.called
+        with mock.patch.object(scg, 'make_graph') as mock_make_graph:
+            scg.visualize()
+        assert not mock_make_graph.called
+
+
+@with_setup(no_setup, erase_grammar_graphs)
+def test_visualize_all():
+    graphs = [GrammarGraph(structs.graph_testing_grammar[:i])
+              for i in [8, 4, 2]]
+    graphs[0].visualize()
+    with mock.patch.object(graphs[0], 'make_graph') as mock_make_graph:
+        visualize_all(graphs)
+    assert not mock_make_graph.called
+    fs = gridfs.GridFS(db.get_pymongo_db(), collection=GrammarGraph.FS_COLL)
+    for graph in graphs:
+        stored = fs.get_last_version(filename=graph.filename)
+        data = stored.read()
+        assert data == graph.string()
+        assert stored.md5 == hashlib.md5(data).hexdigest()
+        svg = fs.get_last_version(filename=render_filename(
+            graph.filename[:-len('.dot')], stored.md5, 'svg'))
+        assert svg.metadata['source'] == stored._id
+        assert '<svg' in svg.read()
+
+
+@with_setup(no_setup, erase_grammar_graphs)
+def test_visualize_all_progress():
+    graphs = [GrammarGraph(structs.graph_testing_grammar[:i])
+              for i in [8, 4, 2]]
+    graphs[1].visualize()
+    reports = []
+    visualize_all(graphs, progress=lambda *args: reports.append(args))
+    assert reports == [(1, 3), (3, 3)]
+
+
+@with_setup(no_setup, erase_grammar_graphs)
+def test_visualize_all_twice():
+    graphs = [GrammarGraph(structs.graph_testing_grammar),
+              GrammarGraph(structs.graph_testing_grammar[::-1])]
+    visualize_all(graphs)
+    visualize_all(graphs)
+    files = db.get_pymongo_db()[GrammarGraph.FS_COLL].files
+    assert files.find({'filename': graphs[0].filename}).count() == 1
+
+
+@with_setup(no_setup, erase_grammar_graphs)
+def test_visualize_all_touches_stored_graphs():
+    files = db.get_pymongo_db()[GrammarGraph.FS_COLL].files
+    graph = GrammarGraph(structs.graph_testing_grammar)
+    graph.visualize()
+    stale = datetime.utcnow() - timedelta(days=1)
+    files.update({}, {'$set': {'metadata.last_access': stale}})
+    visualize_all([graph])
+    stored = files.find_one({'filename': graph.filename})
+    assert stored['metadata']['last_access'] > stale
+
+
+@with_setup(no_setup, erase_grammar_graphs)
+def test_remove_expired_grammar_graphs():
+    pymongodb = db.get_pymongo_db()
+    files = pymongodb[GrammarGraph.FS_COLL].files
+    graphs = [GrammarGraph(structs.graph_testing_grammar[:i])
+              for i in [8, 4]]
+    for graph in graphs:
+        graph.visualize()
+        RenderedGraph(graph.filename[:-len('.dot')], 'svg',
+                      GrammarGraph.FS_COLL).read()
+    expired = datetime.utcnow() - GRAMMAR_GRAPH_TTL * 2
+    files.update({'filename': graphs[0].filename},
+                 {'$set': {'metadata.last_access': expired}})
+    assert remove_expired_grammar_graphs() == 2
+    assert files.count() == 2
+    assert files.find({'filename': graphs[1].filename}).count() == 1
+    file_ids = files.distinct('_id')
+    assert not pymongodb[GrammarGraph.FS_COLL].chunks.find(
+        {'files_id': {'$nin': file_ids}}).count()
+
+
+def test_grammar_graph_key():
+    grammar = structs.graph_testing_grammar
+    assert grammar_graph_key(grammar) == grammar_graph_key(grammar[::-1])
+    renamed = [[c.lower() for c in rel] for rel in grammar]
+    assert grammar_graph_key(grammar) != grammar_graph_key(renamed)
+    assert grammar_graph_key(grammar) != grammar_graph_key(grammar[1:])
+
+
+@with_setup(no_setup, erase_temp_files)
+def test_remove_dataset_graphs():
+    pymongodb = db.get_pymongo_db()
+    dset_ids = [ObjectId(), ObjectId()]
+    for i, dset_id in enumerate(dset_ids):
+        graph = SubclassGraph(dset_name='temp', basename='test%d' % i,
+                              dset_id=dset_id)
+        graph.visualize()
+        RenderedGraph(graph.filename[:-len('.dot')], 'svg').read()
+    assert pymongodb.tmp.files.find({'metadata.dataset': dset_ids[0]}
+                                    ).count() == 2
+    assert remove_dataset_graphs(dset_ids[:1]) == 2
+    assert not pymongodb.tmp.files.find({'metadata.dataset': dset_ids[0]}
+                                        ).count()
+    assert pymongodb.tmp.files.find({'metadata.dataset': dset_ids[1]}
+                                    ).count() == 2
+    file_ids = pymongodb.tmp.files.distinct('_id')
+    assert not pymongodb.tmp.chunks.find(
+        {'files_id': {'$nin': file_ids}}).count()
+
+
+@with_setup(no_setup, erase_temp_files)
+def test_rendered_graph():
+    SubclassGraph(dset_name='temp', basename='test').visualize()
+    with mock.patch('rankomatic.models.graphs.render') as mock_render:
+        graph = RenderedGraph('temp/test', 'svg')
+        svg = graph.read()
+    assert not mock_render.called
+    assert graph.mimetype == 'image/svg+xml'
+    assert graph.etag.endswith('.svg')
+    assert '<svg' in svg
+
+
+@with_setup(no_setup, erase_temp_files)
+def test_rendered_graph_on_request():
+    SubclassGraph(dset_name='temp', basename='test').visualize()
+    png = RenderedGraph('temp/test', 'png').read()
+    assert png.startswith('\x89PNG')
+    with mock.patch('rankomatic.models.graphs.render') as mock_render:
+        assert RenderedGraph('temp/test', 'png').read() == png
+    assert not mock_render.called
+
+
+@with_setup(no_setup, erase_temp_files)
+def test_rendered_graph_dot():
+    SubclassGraph(dset_name='temp', basename='test').visualize()
+    graph = RenderedGraph('temp/test', 'dot')
+    assert '->' in graph.read()
+    assert graph.etag != RenderedGraph('temp/test', 'svg').etag
+
+
+@raises(gridfs.NoFile)
+def test_rendered_graph_not_stored():
+    RenderedGraph('temp/not_stored', 'svg')
+
+
+def test_render():
+    assert render('digraph { a -> b }', 'svg').startswith('<?xml')
 
 
 def test_entailment_graph():
@@ -74,12 +230,13 @@ def test_entailment_graph():
         graph = EntailmentGraph(ents[i], {}, 'temp',
                                 cots_by_cand[i])
         graph_str = graph_strings[i]
-    yield (check_graph_works, graph, graph_str, 'temp/entailments.png')
+    yield (check_graph_works, graph, graph_str, 'temp/entailments.dot')
 
 
 def test_grammar_graph():
-    graph = GrammarGraph(structs.graph_testing_grammar, 'temp', 0)
-    filename = 'temp/grammar0.png'
+    graph = GrammarGraph(structs.graph_testing_grammar)
+    filename = 'grammars/%s.dot' % grammar_graph_key(
+        structs.graph_testing_grammar)
     yield check_graph_works, graph, structs.grammar_graph_string, filename
 
 
@@ -87,7 +244,7 @@ def test_grammar_graph():
 @with_setup(no_setup, erase_temp_files)
 def check_graph_works(graph, graph_str, filename, mock_layout):
     graph.make_graph()
-    assert mock_layout.called
+    assert not mock_layout.called  # left until the graph is rendered
     assert graph.string() == graph_str
     assert graph.filename == filename
 
@@ -113,3 +270,30 @@ def test_apriori_entailment_graph():
     graph.make_graph()
     assert len(graph.nodes()) == 8
     assert len(graph.edges()) == 12
+
+
+def test_reduce_graph_collapses_cycles():
+    successors = {'a': ['a', 'b'], 'b': ['a', 'c'], 'c': ['d'], 'd': ['c']}
+    components, edges = reduce_graph(successors)
+    assert components == [['a', 'b'], ['c', 'd']]
+    assert edges == [(0, 1)]
+
+
+def test_reduce_graph_drops_implied_edges():
+    successors = {'a': ['b', 'c', 'd'], 'b': ['c', 'd'], 'c': ['d']}
+    components, edges = reduce_graph(successors)
+    assert components == [['a'], ['b'], ['c'], ['d']]
+    assert edges == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_transitive_reduction():
+    # 0 -> 1 -> 3, 0 -> 2 -> 3, 0 -> 3
+    dag = [0b1110, 0b1000, 0b1000, 0]
+    assert transitive_reduction(dag) == [0b0110, 0b1000, 0b1000, 0]
+
+
+def test_apriori_entailment_graph_unknown_candidate():
+    graph = EntailmentGraph({'a, b': ['a, b']}, {'a, c': ['a, b']}, 'temp',
+                            {'a, b': 0})
+    with assert_raises(KeyError):
+        graph.make_graph()
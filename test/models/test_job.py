@@ -0,0 +1,76 @@
+import datetime
+import mock
+from bson.objectid import ObjectId
+from nose import with_setup
+
+from rankomatic.models.job import Job, to_millis, from_millis
+
+
+def delete_jobs():
+    Job.objects.delete()
+
+
+def no_setup():
+    pass
+
+
+@with_setup(no_setup, delete_jobs)
+def test_publish_to_merged_jobs():
+    jobs = [Job(func='make_grammar_info') for i in range(3)]
+    for job in jobs:
+        job.save()
+    Job.publish([job.id for job in jobs[:2]], 'done')
+    states = [Job.objects.get(id=job.id).state for job in jobs]
+    assert states == ['done', 'done', 'queued']
+    assert Job.objects.get(id=jobs[0].id).finished
+    assert not Job.objects.get(id=jobs[2].id).finished
+
+
+@with_setup(no_setup, delete_jobs)
+def test_wait_returns_changed_job():
+    job = Job(func='calculate_entailments')
+    job.save()
+    Job.publish([job.id], 'running')
+    with mock.patch('time.sleep') as mock_sleep:
+        assert Job.wait(job.id, 'queued').state == 'running'
+    assert not mock_sleep.called
+
+
+@mock.patch('rankomatic.models.job.JOB_WAIT_INTERVAL', 0.01)
+@mock.patch('rankomatic.models.job.JOB_WAIT_TIMEOUT', 0.05)
+@with_setup(no_setup, delete_jobs)
+def test_wait_times_out():
+    job = Job(func='calculate_entailments')
+    job.save()
+    assert Job.wait(job.id, 'queued').state == 'queued'
+
+
+@mock.patch('rankomatic.models.job.JOB_WAIT_INTERVAL', 0)
+@mock.patch('rankomatic.models.job.JOB_STREAM_TIMEOUT', 1)
+@with_setup(no_setup, delete_jobs)
+def test_changes():
+    dset_id = ObjectId()
+    since = datetime.datetime(2001, 1, 1)
+    old, finished, running, other = [
+        Job(func='calculate_entailments', dataset=d)
+        for d in [dset_id, dset_id, dset_id, ObjectId()]
+    ]
+    old.updated = datetime.datetime(2000, 1, 1)
+    finished.state = 'done'
+    finished.updated = since
+    running.state = 'running'
+    for job in [old, finished, running, other]:
+        job.save()
+    changes = Job.changes(dset_id, since)
+    assert [changes.next().id for i in range(2)] == [finished.id, running.id]
+    Job.publish_progress([running.id, other.id], {'stage': 'grammars'})
+    changed = changes.next()
+    assert changed.id == running.id
+    assert changed.progress == {'stage': 'grammars'}
+    assert list(changes) == []
+
+
+def test_millis():
+    when = datetime.datetime(2014, 7, 1, 12, 30, 15, 250000)
+    assert to_millis(when) == 1404217815250
+    assert from_millis(to_millis(when)) == when
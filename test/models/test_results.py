@@ -0,0 +1,52 @@
+import datetime
+
+import ot.data
+from nose import with_setup
+
+from rankomatic.models import Dataset
+from rankomatic.models.results import CachedResult, LAST_USED_RESOLUTION
+
+
+def delete_results():
+    CachedResult.objects.delete()
+
+
+def no_setup():
+    pass
+
+
+def make_dset(name='voweldset'):
+    data = {
+        'constraints': ['c1', 'c2', 'c3', 'c4'],
+        'candidates': ot.data.voweldset,
+        'name': name
+    }
+    return Dataset(data=data, data_is_from_form=False)
+
+
+@with_setup(no_setup, delete_results)
+def test_store_and_lookup():
+    dset = make_dset()
+    assert CachedResult.lookup(dset, 'global_stats', 0) is None
+    CachedResult.store(dset, 'global_stats', {'num_cots': 0}, 0)
+    assert CachedResult.lookup(dset, 'global_stats', 0) == {'num_cots': 0}
+    assert CachedResult.objects.get().last_used is not None
+
+
+@with_setup(no_setup, delete_results)
+def test_lookup_marks_stale_results_used():
+    dset = make_dset()
+    CachedResult.store(dset, 'global_stats', {}, 0)
+    stale = datetime.datetime.utcnow() - LAST_USED_RESOLUTION * 2
+    CachedResult.objects.update(set__last_used=stale)
+    CachedResult.lookup(dset, 'global_stats', 0)
+    assert CachedResult.objects.get().last_used > stale
+
+
+@with_setup(no_setup, delete_results)
+def test_backfill_last_used():
+    CachedResult.objects(key='old').update_one(set__value=1, upsert=True)
+    assert CachedResult.objects.get(key='old').last_used is None
+    CachedResult.backfill_last_used()
+    assert CachedResult.objects.get(key='old').last_used is not None
+
@@ -116,7 +116,7 @@ invalid_forms = [
 grammar_info = [
     {
         'grammar': "{(C1, C2)}",
-        'filename': "grammar0.png",
+        'filename': "grammar0.svg",
         'cots_by_cand': {
             'I1': [
                 {
@@ -140,7 +140,7 @@ grammar_info = [
     },
     {
         'grammar': "{(C2, C3)}",
-        'filename': "grammar1.png",
+        'filename': "grammar1.svg",
         'cots_by_cand': {
             'I1': [
                 {
@@ -240,25 +240,25 @@ cots_by_cand_with_cycles = {
 }
 
 entailments_with_cycles_graph_string = (
-    u'strict digraph {\n\tgraph [encoding="UTF-8"];\n\tnode [label="\\N",\n'
-    '\t\tshape=rect\n\t];\n\t"<<FONT POINT-SIZE=\\"14\\">(I4, O5)<BR/>(I2, O'
-    '5)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>"\t [label='
-    '<<FONT POINT-SIZE="14">(I4, O5)<BR/>(I2, O5)</FONT><BR/><FONT POINT-SIZ'
-    'E="10"><B>RV: 0</B></FONT>>];\n\t"<<FONT POINT-SIZE=\\"14\\">(I1, O2)<B'
-    'R/>(I3, O4)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>"'
-    '\t [label=<<FONT POINT-SIZE="14">(I1, O2)<BR/>(I3, O4)</FONT><BR/><FONT '
-    'POINT-SIZE="10"><B>RV: 0</B></FONT>>];\n\t"<<FONT POINT-SIZE=\\"14\\">('
-    'I4, O5)<BR/>(I2, O5)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B><'
-    '/FONT>>" -> "<<FONT POINT-SIZE=\\"14\\">(I1, O2)<BR/>(I3, O4)</FONT><BR'
-    '/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>";\n\t"<<FONT POINT-SIZ'
-    'E=\\"14\\">(I1, O1)<BR/>(I3, O2)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><'
-    'B>RV: 0</B></FONT>>"\t [label=<<FONT POINT-SIZE="14">(I1, O1)<BR/>(I3, '
-    'O2)</FONT><BR/><FONT POINT-SIZE="10"><B>RV: 0</B></FONT>>];\n\t"<<FONT '
-    'POINT-SIZE=\\"14\\">(I2, O4)<BR/>(I4, O3)</FONT><BR/><FONT POINT-SIZE='
-    '\\"10\\"><B>RV: 0</B></FONT>>"\t [label=<<FONT POINT-SIZE="14">(I2, O4)'
-    '<BR/>(I4, O3)</FONT><BR/><FONT POINT-SIZE="10"><B>RV: 0</B></FONT>>];\n'
-    '\t"<<FONT POINT-SIZE=\\"14\\">(I1, O1)<BR/>(I3, O2)</FONT><BR/><FONT PO'
-    'INT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>" -> "<<FONT POINT-SIZE=\\"14\\">'
-    '(I2, O4)<BR/>(I4, O3)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B>'
-    '</FONT>>";\n}\n'
+    u'strict digraph {\n\tgraph [encoding="UTF-8"];\n\tnode [label="\\N",\n\t'
+    '\tshape=rect\n\t];\n\t"<<FONT POINT-SIZE=\\"14\\">(I1, O1)<BR/>(I3, O2)'
+    '</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>"\t [label=<<'
+    'FONT POINT-SIZE="14">(I1, O1)<BR/>(I3, O2)</FONT><BR/><FONT POINT-SIZE='
+    '"10"><B>RV: 0</B></FONT>>];\n\t"<<FONT POINT-SIZE=\\"14\\">(I2, O4)<BR/'
+    '>(I4, O3)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>"\t '
+    '[label=<<FONT POINT-SIZE="14">(I2, O4)<BR/>(I4, O3)</FONT><BR/><FONT PO'
+    'INT-SIZE="10"><B>RV: 0</B></FONT>>];\n\t"<<FONT POINT-SIZE=\\"14\\">(I1'
+    ', O1)<BR/>(I3, O2)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></F'
+    'ONT>>" -> "<<FONT POINT-SIZE=\\"14\\">(I2, O4)<BR/>(I4, O3)</FONT><BR/>'
+    '<FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></FONT>>";\n\t"<<FONT POINT-SIZE='
+    '\\"14\\">(I1, O2)<BR/>(I3, O4)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>'
+    'RV: 0</B></FONT>>"\t [label=<<FONT POINT-SIZE="14">(I1, O2)<BR/>(I3, O4'
+    ')</FONT><BR/><FONT POINT-SIZE="10"><B>RV: 0</B></FONT>>];\n\t"<<FONT PO'
+    'INT-SIZE=\\"14\\">(I2, O5)<BR/>(I4, O5)</FONT><BR/><FONT POINT-SIZE=\\"'
+    '10\\"><B>RV: 0</B></FONT>>"\t [label=<<FONT POINT-SIZE="14">(I2, O5)<BR'
+    '/>(I4, O5)</FONT><BR/><FONT POINT-SIZE="10"><B>RV: 0</B></FONT>>];\n\t"'
+    '<<FONT POINT-SIZE=\\"14\\">(I2, O5)<BR/>(I4, O5)</FONT><BR/><FONT POINT'
+    '-SIZE=\\"10\\"><B>RV: 0</B></FONT>>" -> "<<FONT POINT-SIZE=\\"14\\">(I1'
+    ', O2)<BR/>(I3, O4)</FONT><BR/><FONT POINT-SIZE=\\"10\\"><B>RV: 0</B></F'
+    'ONT>>";\n}\n'
 )
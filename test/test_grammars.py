@@ -1,3 +1,4 @@
+import datetime
 import mock
 import json
 import gridfs
@@ -6,8 +7,11 @@ from flask import url_for
 
 from test import OTOrderBaseCase
 from test_tools import delete_bad_datasets
-from rankomatic.models import Dataset
-from structures import structures, png_filename
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.models import Dataset, Job
+from rankomatic.models.graphs import GrammarGraph, remove_graph_files
+from rankomatic.models.job import to_millis
+from structures import structures
 
 
 class MockJob(mock.MagicMock):
@@ -82,26 +86,53 @@ class TestGraph(OTOrderBaseCase):
 
     def setUp(self):
         self.dset_name = "blank"
-        self.filename = "arnold.png"
-        path = "/".join([self.dset_name, self.filename])
+        self.filename = "arnold.svg"
+        path = "/".join([self.dset_name, "arnold.dot"])
         self.fs = gridfs.GridFS(self.db.get_pymongo_db(), collection='tmp')
-        with open(png_filename, 'rb') as png:
-            self.png_id = self.fs.put(png, filename=path)
+        self.fs.put('digraph { a -> b }', filename=path)
 
     def tearDown(self):
         delete_bad_datasets()
-        self.fs.delete(self.png_id)
+        for filename in self.fs.list():
+            if filename.startswith(self.dset_name + '/arnold.'):
+                self.fs.delete(self.fs.get_last_version(filename)._id)
+
+    def get_graph(self, filename, **headers):
+        return self.client.get(url_for('grammars.graph',
+                                       dset_name=self.dset_name,
+                                       filename=filename),
+                               headers=headers)
 
     def test_good_get(self):
-        response = self.client.get(url_for('grammars.graph',
-                                           dset_name=self.dset_name,
-                                           filename=self.filename))
+        response = self.get_graph(self.filename)
+        self.assert_200(response)
+        assert response.headers['Content-Type'] == 'image/svg+xml'
+        assert response.headers['Cache-Control'] == 'public, no-cache'
+        assert response.headers['ETag']
+
+    def test_get_dot(self):
+        response = self.get_graph('arnold.dot')
         self.assert_200(response)
-        assert response.headers['Content-Type'] == 'image/png'
+        assert response.headers['Content-Type'].startswith(
+            'text/vnd.graphviz')
+        assert response.data == 'digraph { a -> b }'
+
+    def test_get_renders_once(self):
+        self.get_graph(self.filename)
+        with mock.patch('rankomatic.models.graphs.render') as mock_render:
+            self.assert_200(self.get_graph(self.filename))
+        assert not mock_render.called
+
+    def test_conditional_get(self):
+        etag = self.get_graph(self.filename).headers['ETag']
+        response = self.get_graph(self.filename, **{'If-None-Match': etag})
+        self.assertStatus(response, 304)
+        assert not response.data
 
     def test_bad_gets(self):
         combos = [('NOT_A_DSET_NAME', self.filename),
                   (self.dset_name, 'NOT_A_FILENAME'),
+                  (self.dset_name, 'arnold.gif'),
                   ('NOT_A_DSET_NAME', 'NOT_A_FILENAME')]
 
         for combo in combos:
@@ -111,6 +142,30 @@ class TestGraph(OTOrderBaseCase):
             self.assert_404(response)
 
 
+class TestGrammarGraph(OTOrderBaseCase):
+
+    def setUp(self):
+        self.graph = GrammarGraph([['a', 'b']])
+        self.graph.visualize()
+
+    def tearDown(self):
+        remove_graph_files({'filename': self.graph.filename},
+                           GrammarGraph.FS_COLL)
+
+    def test_good_get(self):
+        response = self.client.get(url_for(
+            'grammars.grammar_graph', filename=self.graph.basename + '.dot'
+        ))
+        self.assert_200(response)
+        assert response.headers['Cache-Control'] == 'public, max-age=31536000'
+        assert 'a -> b' in response.data
+
+    def test_bad_get(self):
+        response = self.client.get(url_for('grammars.grammar_graph',
+                                           filename='NOT_A_GRAMMAR.svg'))
+        self.assert_404(response)
+
+
 class TestEntailmentsCalculated(OTOrderBaseCase):
 
     def make_entailment_dset(self, name, calculated, visualized):
@@ -175,8 +230,9 @@ class TestGlobalStatsCalculated(OTOrderBaseCase):
         dset.global_stats_calculated = True
         dset.classical = True
         dset.grammar_navbar['lengths'] = [6]
-        dset.global_stats['grams'] = str([frozenset([(1, 2), (1, 3), (1, 4),
-                                                     (2, 3), (2, 4), (3, 4)])])
+        dset.global_stats['grams'] = [[0, grammar_id([(1, 2), (1, 3), (1, 4),
+                                                      (2, 3), (2, 4),
+                                                      (3, 4)])]]
         dset.save()
 
         response = self.client.get(url_for('grammars.global_stats_calculated',
@@ -195,7 +251,7 @@ class TestGlobalStatsCalculated(OTOrderBaseCase):
         dset.global_stats_calculated = True
         dset.classical = False
         dset.grammar_navbar['lengths'] = [1, 3, 6]
-        dset.global_stats['grams'] = "[]"
+        dset.global_stats['grams'] = []
         dset.save()
 
         response = self.client.get(url_for('grammars.global_stats_calculated',
@@ -216,7 +272,7 @@ class TestGlobalStatsCalculated(OTOrderBaseCase):
         dset.classical = False
         dset.grammar_navbar['lengths'] = []
         dset.global_stats = {
-            'grams': "[]",
+            'grams': [],
             'num_poots': 0,
             'num_total_poots': 19,
             'percent_poots': 0.0,
@@ -239,14 +295,15 @@ class TestGlobalStatsCalculated(OTOrderBaseCase):
         assert not data['grammars_exist']
         assert not mock_make_grammar_info.called
 
-    @mock.patch('rankomatic.worker_jobs.make_grammar_info')
+    @mock.patch('rankomatic.worker_jobs.make_grammar_info',
+                return_value='job-id')
     def test_no_redirect_html_response(self, mock_make_grammar_info):
         dset = Dataset(name='blank', user='guest')
         dset.global_stats_calculated = True
         dset.classical = False
         dset.grammar_navbar['lengths'] = [1, 3, 6]
         dset.global_stats = {
-            'grams': "[frozenset([(1, 2)]), frozenset([2, 3])]",
+            'grams': [[0, grammar_id([(1, 2)])], [1, grammar_id([(2, 3)])]],
             'num_poots': 5,
             'num_total_poots': 19,
             'percent_poots': 5.0/19,
@@ -268,7 +325,8 @@ class TestGlobalStatsCalculated(OTOrderBaseCase):
         assert not data['retry']
         assert data['html_str']
         assert data['grammar_stat_url']
-        mock_make_grammar_info.assert_called_with('blank')
+        assert data['grammar_stat_job'] == 'job-id'
+        mock_make_grammar_info.assert_called_with('blank', mock.ANY)
 
 
 class TestGrammarStatsCalculated(OTOrderBaseCase):
@@ -342,7 +400,8 @@ class TestEntailment(OTOrderBaseCase):
                                            dset_name=self.dset_name))
         self.assert_200(response)
         assert "Entailments" in response.data
-        mock_calculate_entailments.assert_called_with(self.dset_name)
+        mock_calculate_entailments.assert_called_with(self.dset_name,
+                                                      mock.ANY)
         self.assert_template_used('entailments.html')
 
 
@@ -365,6 +424,80 @@ class TestAprioriEntailments(TestEntailment):
         assert dset.apriori_ranking.string == "{(a, c), (a, b)}"
 
 
+class TestJob(OTOrderBaseCase):
+
+    def setUp(self):
+        self.job = Job(func='calculate_entailments')
+        self.job.save()
+
+    def tearDown(self):
+        Job.objects.delete()
+
+    def test_get_changed_state(self):
+        Job.publish([self.job.id], 'done')
+        response = self.client.get(url_for('grammars.job', job_id=self.job.id,
+                                           state='queued'))
+        self.assert_200(response)
+        assert json.loads(response.data) == {
+            'id': str(self.job.id), 'func': 'calculate_entailments',
+            'state': 'done', 'progress': {}
+        }
+
+    @mock.patch('rankomatic.models.job.JOB_WAIT_INTERVAL', 0.01)
+    @mock.patch('rankomatic.models.job.JOB_WAIT_TIMEOUT', 0.05)
+    def test_get_unchanged_state_times_out(self):
+        response = self.client.get(url_for('grammars.job', job_id=self.job.id,
+                                           state='queued'))
+        self.assert_200(response)
+        assert json.loads(response.data)['state'] == 'queued'
+
+    def test_bad_get(self):
+        response = self.client.get(url_for('grammars.job',
+                                           job_id='NOT_A_JOB'))
+        self.assert_404(response)
+
+
+class TestProgress(OTOrderBaseCase):
+
+    def tearDown(self):
+        Job.objects.delete()
+        delete_bad_datasets()
+
+    def setUp(self):
+        dset = Dataset(name='blank', user='guest')
+        dset.save()
+        self.job = Job(func='calculate_entailments', dataset=dset.id,
+                       state='running', progress={'stage': 'graphs'},
+                       updated=datetime.datetime(2014, 7, 1))
+        self.job.save()
+
+    @mock.patch('rankomatic.models.job.JOB_STREAM_TIMEOUT', 0)
+    def test_get(self):
+        since = to_millis(self.job.updated)
+        response = self.client.get(url_for('grammars.progress',
+                                           dset_name='blank', since=since))
+        self.assert_200(response)
+        assert response.mimetype == 'text/event-stream'
+        events = response.data.split('\n\n')
+        assert events[0] == 'retry: 1000'
+        event_id, data = events[1].split('\n')
+        assert event_id == 'id: %d' % since
+        assert json.loads(data[len('data: '):]) == self.job.to_dict()
+
+    @mock.patch('rankomatic.models.job.JOB_STREAM_TIMEOUT', 0)
+    def test_get_resumes_from_last_event(self):
+        last_event = to_millis(self.job.updated) + 1
+        response = self.client.get(url_for('grammars.progress',
+                                           dset_name='blank', since=0),
+                                   headers={'Last-Event-ID': last_event})
+        assert response.data.split('\n\n')[1:] == ['']
+
+    def test_bad_since(self):
+        response = self.client.get(url_for('grammars.progress',
+                                           dset_name='blank', since='soon'))
+        self.assert_400(response)
+
+
 class TestStatProfile(OTOrderBaseCase):
 
     def test_get(self):
@@ -0,0 +1,75 @@
+from rankomatic.scheduler import (Scheduler, FairQueue, job_lane,
+                                  INTERACTIVE, BATCH, MAX_INTERACTIVE_COST)
+
+
+def make_msg(func='calculate_entailments', user='guest', cost=0, name=''):
+    return {'func': func, 'user': user, 'cost': cost, 'name': name}
+
+
+HEAVY = MAX_INTERACTIVE_COST + 1
+
+
+def test_job_lane():
+    assert job_lane(make_msg(cost=MAX_INTERACTIVE_COST)) == INTERACTIVE
+    assert job_lane(make_msg(cost=HEAVY)) == BATCH
+    assert job_lane(make_msg('make_grammar_info', cost=HEAVY)) == INTERACTIVE
+
+
+def test_fair_queue_takes_turns():
+    queue = FairQueue()
+    for job in ['a1', 'a2', 'a3']:
+        queue.push('a', job)
+    queue.push('b', 'b1')
+    assert len(queue) == 2
+    assert [queue.pop() for i in range(4)] == ['a1', 'b1', 'a2', 'a3']
+    assert not queue
+
+
+def test_interactive_jobs_first():
+    scheduler = Scheduler(1)
+    scheduler.add(make_msg(cost=HEAVY, name='heavy'))
+    scheduler.add(make_msg('make_grammar_info', name='page'))
+    assert [msg['name'] for w, msg in scheduler.assign()] == ['page']
+    scheduler.release(0)
+    assert [msg['name'] for w, msg in scheduler.assign()] == ['heavy']
+
+
+def test_reserved_workers():
+    scheduler = Scheduler(3, reserved=1)
+    for i in range(3):
+        scheduler.add(make_msg(cost=HEAVY, name='heavy%d' % i))
+    assert [w for w, msg in scheduler.assign()] == [0, 1]
+    scheduler.add(make_msg(name='light'))
+    assert [(w, msg['name']) for w, msg in scheduler.assign()] == [
+        (2, 'light')]
+    scheduler.release(2)
+    assert not list(scheduler.assign())
+    scheduler.release(0)
+    assert [(w, msg['name']) for w, msg in scheduler.assign()] == [
+        (2, 'heavy2')]
+
+
+def test_one_worker_runs_batch_jobs():
+    scheduler = Scheduler(1, reserved=1)
+    scheduler.add(make_msg(cost=HEAVY))
+    assert len(list(scheduler.assign())) == 1
+
+
+def test_users_take_turns():
+    scheduler = Scheduler(1)
+    for i in range(3):
+        scheduler.add(make_msg(user='busy', name='busy%d' % i))
+    scheduler.add(make_msg(user='other', name='other'))
+    names = []
+    for i in range(4):
+        names.extend(msg['name'] for w, msg in scheduler.assign())
+        scheduler.release(0)
+    assert names == ['busy0', 'other', 'busy1', 'busy2']
+
+
+def test_release_idle_worker():
+    scheduler = Scheduler(1)
+    scheduler.release(0)
+    scheduler.add(make_msg())
+    scheduler.add(make_msg())
+    assert len(list(scheduler.assign())) == 1
@@ -2,6 +2,7 @@ from flask import url_for, session
 from test import OTOrderBaseCase
 from rankomatic.forms import TableauxForm
 from rankomatic.models import Dataset, User
+from rankomatic.models.results import CachedResult
 import mock
 from rankomatic.tools import CalculatorView
 
@@ -29,6 +30,7 @@ def delete_bad_datasets():
     dsets = [d for d in Dataset.objects() if is_bad_dset(d)]
     for dset in dsets:
         dset.delete()
+    CachedResult.objects.delete()
 
 
 def is_bad_dset(dset):
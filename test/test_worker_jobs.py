@@ -7,12 +7,15 @@ from nose import with_setup
 from test import OTOrderBaseCase
 from test_tools import delete_bad_datasets
 from rankomatic import worker_jobs
-from rankomatic.models import Dataset
+from rankomatic.lattice.encoding import grammar_id
+from rankomatic.models import Dataset, Job
+from rankomatic.models.graphs import grammar_graph_key
 from rankomatic.worker_jobs import (calculate_grammars_and_statistics,
                                     calculate_entailments, make_grammar_info,
                                     _calculate_entailments,
                                     _calculate_grammars_and_statistics,
-                                    GrammarInfoMaker)
+                                    GrammarInfoMaker, job_key, job_version,
+                                    job_cost)
 
 
 mod = {}
@@ -69,7 +72,7 @@ def test_calculate_global_stats(mock_get_grammars):
     global_stats = {
         u'num_total_poots': 219,
         u'num_total_cots': 24,
-        u'grams': u'[(10, frozenset([(3, 1), (2, 1)]))]',
+        u'grams': [[10, grammar_id(frozenset([(3, 1), (2, 1)]))]],
         u'percent_cots': 0.0,
         u'num_poots': 11,
         u'num_cots': 0,
@@ -90,14 +93,14 @@ def test_calculate_global_stats_classical(mock_get_grammars):
     global_stats = {
         u'num_total_cots': 24,
         u'num_cots': 6,
-        u'grams':
-        (u'['
-         '(0, frozenset([(3, 2), (3, 4), (3, 1), (2, 1), (4, 1), (2, 4)])), '
-         '(1, frozenset([(3, 2), (3, 1), (2, 1), (4, 3), (4, 2), (4, 1)])), '
-         '(2, frozenset([(1, 2), (3, 2), (3, 1), (4, 3), (4, 2), (4, 1)])), '
-         '(3, frozenset([(1, 2), (3, 2), (1, 3), (4, 3), (4, 2), (4, 1)])), '
-         '(4, frozenset([(3, 2), (3, 4), (3, 1), (2, 1), (4, 2), (4, 1)])), '
-         '(5, frozenset([(1, 2), (3, 2), (3, 4), (3, 1), (4, 2), (4, 1)]))]'),
+        u'grams': [
+            [0, grammar_id([(3, 2), (3, 4), (3, 1), (2, 1), (4, 1), (2, 4)])],
+            [1, grammar_id([(3, 2), (3, 1), (2, 1), (4, 3), (4, 2), (4, 1)])],
+            [2, grammar_id([(1, 2), (3, 2), (3, 1), (4, 3), (4, 2), (4, 1)])],
+            [3, grammar_id([(1, 2), (3, 2), (1, 3), (4, 3), (4, 2), (4, 1)])],
+            [4, grammar_id([(3, 2), (3, 4), (3, 1), (2, 1), (4, 2), (4, 1)])],
+            [5, grammar_id([(1, 2), (3, 2), (3, 4), (3, 1), (4, 2), (4, 1)])]
+        ],
         u'percent_cots': 25.0
     }
     _calculate_grammars_and_statistics('cv_dset', 1, True, 0, 'guest',
@@ -115,14 +118,14 @@ def test_calculate_global_stats_classical_sort_by_size(mock_get_grammars):
     global_stats = {
         u'num_total_cots': 24,
         u'num_cots': 6,
-        u'grams':
-        (u'['
-         '(0, frozenset([(3, 2), (3, 4), (3, 1), (2, 1), (4, 1), (2, 4)])), '
-         '(1, frozenset([(3, 2), (3, 1), (2, 1), (4, 3), (4, 2), (4, 1)])), '
-         '(2, frozenset([(1, 2), (3, 2), (3, 1), (4, 3), (4, 2), (4, 1)])), '
-         '(3, frozenset([(1, 2), (3, 2), (1, 3), (4, 3), (4, 2), (4, 1)])), '
-         '(4, frozenset([(3, 2), (3, 4), (3, 1), (2, 1), (4, 2), (4, 1)])), '
-         '(5, frozenset([(1, 2), (3, 2), (3, 4), (3, 1), (4, 2), (4, 1)]))]'),
+        u'grams': [
+            [0, grammar_id([(3, 2), (3, 4), (3, 1), (2, 1), (4, 1), (2, 4)])],
+            [1, grammar_id([(3, 2), (3, 1), (2, 1), (4, 3), (4, 2), (4, 1)])],
+            [2, grammar_id([(1, 2), (3, 2), (3, 1), (4, 3), (4, 2), (4, 1)])],
+            [3, grammar_id([(1, 2), (3, 2), (1, 3), (4, 3), (4, 2), (4, 1)])],
+            [4, grammar_id([(3, 2), (3, 4), (3, 1), (2, 1), (4, 2), (4, 1)])],
+            [5, grammar_id([(1, 2), (3, 2), (3, 4), (3, 1), (4, 2), (4, 1)])]
+        ],
         u'percent_cots': 25.0
     }
     _calculate_grammars_and_statistics('cv_dset', 6, True, 0, 'guest', 'size')
@@ -143,7 +146,7 @@ def test_calculate_global_stats_adjust_grams_per_page(mock_get_grammars):
     assert mock_get_grammars.called_with(True)
     worker_jobs.GRAMS_PER_PAGE = grams_per_page
     dset = Dataset.objects.get(name='cv_dset')
-    assert len(eval(dset.global_stats['grams'])) == 5
+    assert len(dset.global_stats['grams']) == 5
 
 
 @with_setup(blank_guest_dset, delete_bad_datasets)
@@ -188,7 +191,8 @@ def test_make_grammar_info(mock_get_grammars):
                 u'rasia': {u'raw_sum': 8, u'per_sum': 100.0},
                 u'ovea': {u'raw_sum': 8, u'per_sum': 100.0}
             },
-            u'filename': u'grammar10.png'}]
+            u'filename': grammar_graph_key([[u'c1', u'c3'],
+                                            [u'c1', u'c2']]) + u'.svg'}]
     _calculate_grammars_and_statistics('voweldset', 8, False, 0, 'guest',
                                        'rank_volume')
     info_maker = GrammarInfoMaker('voweldset', 'guest')
@@ -199,11 +203,23 @@ def test_make_grammar_info(mock_get_grammars):
 
 class TestEnqueuingFunctions(OTOrderBaseCase):
 
-    def make_request(self, func, args):
+    def setUp(self):
+        self.dset = Dataset(name='blank', user='guest')
+        self.dset.global_stats = {'grams': [[0, 1]]}
+
+    def tearDown(self):
+        Job.objects.delete()
+
+    def make_request(self, func, args, version, job_id):
         return json.dumps({
             'request': 'calculate',
             'func': func,
-            'args': args
+            'args': args,
+            'version': version,
+            'job_id': job_id,
+            'user': 'guest',
+            'cost': job_cost(func, self.dset),
+            'num_constraints': len(self.dset.constraints)
         })
 
     @mock.patch('Queue.Queue.put')
@@ -211,29 +227,66 @@ class TestEnqueuingFunctions(OTOrderBaseCase):
     def test_calculate_grammars_and_statistics(self, mock_get_queue, mock_put):
         path = "/?classical=False&page=0&sort_by=size"
         with self.app.test_request_context(path=path):
-            calculate_grammars_and_statistics('blank', 0)
+            job_id = calculate_grammars_and_statistics('blank', 0, self.dset)
         assert mock_get_queue.called
         mock_put.assert_called_with(
             self.make_request('calculate_grammars_and_statistics',
-                              ('blank', 0, False, 0, 'guest', 'size'))
+                              ('blank', 0, False, 0, 'guest', 'size'),
+                              job_version(self.dset), job_id)
         )
+        job = Job.objects.get(id=job_id)
+        assert job.func == 'calculate_grammars_and_statistics'
+        assert job.state == 'queued'
+        assert job.dataset == self.dset.id
 
     @mock.patch('Queue.Queue.put')
     @mock.patch('rankomatic.worker_jobs.get_queue', return_value=Queue())
     def test_calculate_entailments(self, mock_get_queue, mock_put):
         with self.app.test_request_context():
-            calculate_entailments('blank')
+            job_id = calculate_entailments('blank', self.dset)
         assert mock_get_queue.called
         mock_put.assert_called_with(self.make_request(
-            'calculate_entailments', ('blank', 'guest')
+            'calculate_entailments', ('blank', 'guest'),
+            job_version(self.dset), job_id
         ))
 
     @mock.patch('Queue.Queue.put')
     @mock.patch('rankomatic.worker_jobs.get_queue', return_value=Queue())
     def test_make_grammar_info(self, mock_get_queue, mock_put):
         with self.app.test_request_context():
-            make_grammar_info('blank')
+            job_id = make_grammar_info('blank', self.dset)
         assert mock_get_queue.called
         mock_put.assert_called_with(self.make_request(
-            'make_grammar_info', ('blank', 'guest')
+            'make_grammar_info', ('blank', 'guest'),
+            job_version(self.dset, 'rank_volume', [[0, 1]]), job_id
         ))
+
+
+def test_job_version():
+    dset = Dataset(name='blank', user='guest')
+    version = job_version(dset)
+    dset.name = 'renamed'
+    assert job_version(dset) == version
+    assert job_version(dset, 'size') != version
+    dset.classical = True
+    assert job_version(dset) != version
+
+
+def test_job_key():
+    msg = {'func': 'calculate_entailments', 'args': ['blank', 'guest'],
+           'version': 'abc'}
+    same = json.loads(json.dumps(msg))
+    assert job_key(msg) == job_key(same)
+    for changed in [{'args': ['blank', 'user']}, {'version': 'def'},
+                    {'func': 'make_grammar_info'}]:
+        assert job_key(msg) != job_key(dict(msg, **changed))
+
+
+def test_job_cost():
+    dset = Dataset(data=ot.data.cv_dset, data_is_from_form=False)
+    dset.global_stats = {'grams': [[0, 1], [1, 2]]}
+    num_candidates = len(dset.candidates)
+    assert job_cost('calculate_entailments', dset) == num_candidates * 219
+    assert job_cost('make_grammar_info', dset) == num_candidates * 2
+    dset.constraints.append('c5')
+    assert job_cost('calculate_entailments', dset) == num_candidates * 4231